@@ -1,7 +1,17 @@
 # app/aws_client.py
 import boto3
 import json
+from typing import Optional
 from s8.core.config import settings
+from app.utils.zip_utils import STATIC_FRAMEWORKS
+
+# S3 client
+s3_client = boto3.client(
+    "s3",
+    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    region_name=settings.AWS_REGION
+)
 
 # SQS client
 sqs_client = boto3.client(
@@ -11,12 +21,34 @@ sqs_client = boto3.client(
     region_name=settings.AWS_REGION
 )
 
-def push_template_task(template_id: str, s3_key: str):
+def push_template_task(template_id: str, s3_key: str, framework: Optional[str] = None):
     """
-    Push template processing task to SQS
+    Push template processing task to SQS. Static templates go to the fast
+    lane (if configured) so they don't wait behind npm builds.
     """
     message_body = {
         "template_id": template_id,
+        "s3_key": s3_key,
+        "framework": framework
+    }
+    queue_url = settings.SQS_QUEUE_URL
+    fast_queue_url = getattr(settings, "SQS_FAST_QUEUE_URL", None)
+    if fast_queue_url and framework in STATIC_FRAMEWORKS:
+        queue_url = fast_queue_url
+    response = sqs_client.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps(message_body)
+    )
+    return response
+
+def push_generated_app_task(project_id: str, s3_key: str):
+    """
+    Push a generated-app preview build to SQS. `kind` tells the worker to
+    build it on its pre-installed base instead of as a template.
+    """
+    message_body = {
+        "kind": "generated_app",
+        "project_id": project_id,
         "s3_key": s3_key
     }
     response = sqs_client.send_message(
@@ -22,6 +22,7 @@ from app.routes.generate_app import router as generate_app_router
 from app.routes.profile import profile_router 
 from app.routes.download import router as download_router
 from app.routes.test import test_router
+from app.utils.artifact_store import sweep_artifacts_forever
 
 # Error Handlers
 from s8.core.error_handlers import (
@@ -129,3 +130,10 @@ async def startup_db_check():
         logging.info("✅ MongoDB connected successfully.")
     except Exception as e:
         logging.error("❌ MongoDB connection failed: %s", e)
+
+# ------------------------
+# Artifact cleanup
+# ------------------------
+@app.on_event("startup")
+async def start_artifact_sweeper():
+    asyncio.create_task(sweep_artifacts_forever())
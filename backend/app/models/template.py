@@ -14,5 +14,6 @@ class Template(BaseModel):
     tags: List[str] = []
     preview_url: Optional[str] = None
     status: str = "pending"
+    framework: Optional[str] = None   # detected from package.json at upload
     is_public: bool = False   # <-- NEW FIELD
     created_at: datetime = Field(default_factory=datetime.utcnow)
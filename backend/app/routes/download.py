@@ -1,26 +1,96 @@
 # app/routes/downloads.py
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-import os
-import tempfile
+import re
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.utils.artifact_store import Artifact, artifact_store
 
 router = APIRouter(prefix="/downloads", tags=["Downloads"])
 
-# Directory where ZIP files are temporarily stored
-ZIP_DIR = tempfile.gettempdir()  # same folder used in generate_app.py
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
 
-@router.get("/{zip_name}")
-async def download_zip(zip_name: str):
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
     """
-    Download a previously generated ZIP file by its name.
+    (start, end) inclusive for a single "bytes=" range, None to send the
+    whole body (no header, or multiple ranges). Raises ValueError when the
+    range can't be satisfied.
     """
-    zip_path = os.path.join(ZIP_DIR, zip_name)
+    if not header:
+        return None
+    match = RANGE_RE.fullmatch(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
 
-    if not os.path.exists(zip_path):
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    # Weak comparison, as If-None-Match calls for
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def serve_artifact(request: Request, artifact: Artifact, filename: str, headers: Optional[dict] = None):
+    """
+    Stream an artifact honouring If-None-Match (304) and single byte
+    ranges (206, with If-Range), so re-downloads are free and large
+    bundles can resume.
+    """
+    headers = {
+        **(headers or {}),
+        "ETag": artifact.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+
+    # Conditional requests only make sense for safe methods
+    conditional = request.method in ("GET", "HEAD")
+    if conditional and etag_matches(request.headers.get("if-none-match"), artifact.etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range") if conditional else None
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != artifact.etag:
+        range_header = None  # the client's partial copy is stale; send it all
+
+    try:
+        byte_range = parse_range(range_header, artifact.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{artifact.size}"})
+
+    status_code = 200
+    start, end = 0, artifact.size - 1
+    if byte_range:
+        status_code = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{artifact.size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    body = artifact_store.iter_range(artifact.name, start, end) if artifact.size else iter(())
+    return StreamingResponse(body, status_code=status_code, media_type=artifact.content_type, headers=headers)
+
+@router.get("/{name}")
+async def download_artifact(name: str, request: Request):
+    """
+    Download a stored artifact (e.g. a generated app bundle) by name.
+    """
+    try:
+        artifact = await run_in_threadpool(artifact_store.stat, name)
+    except ValueError:
+        artifact = None
+    if not artifact:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        path=zip_path,
-        filename=zip_name,    # sets the download filename
-        media_type="application/zip"
-    )
+    return serve_artifact(request, artifact, name)
@@ -1,108 +1,78 @@
 # app/routes/generate_app.py
-from fastapi import APIRouter, HTTPException, Depends, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Request
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, Response, HTMLResponse
+from starlette.concurrency import run_in_threadpool
 from s8.db.database import db
+from s8.core.config import settings
 from app.middleware.rbac import get_current_user
+from app.aws_client import s3_client, push_generated_app_task
+from app.utils.presign_utils import get_presigned_url
+from app.utils.auth_utils import create_preview_token, verify_preview_token
+from app.utils.artifact_store import artifact_store
+from app.utils.static_preview import page_name_of, render_preview
+from app.routes.download import serve_artifact, etag_matches
 from bson import ObjectId
-import os, shutil, tempfile, zipfile, uuid, json
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Optional
+import os, io, zipfile, uuid, json, hashlib, struct, zlib
 
 router = APIRouter(prefix="", tags=["App Generator"])
 
-@router.post("/")
-async def generate_app(
-    data: dict = Body(...),
-    current_user: dict = Depends(get_current_user)
-):
-    """
-    Generate a Vite + React + Tailwind app for a given project.
-    Body: { "project_id": "<id>" }
-    """
-    project_id = data.get("project_id")
-    if not project_id:
-        raise HTTPException(status_code=400, detail="project_id is required")
+# -----------------------------
+# Fixed app skeleton
+# -----------------------------
+# Part of every bundle's cache key: bump it whenever generated output changes
+GENERATOR_VERSION = "3"
 
-    try:
-        obj_id = ObjectId(project_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid project_id")
+# Every generated app shares this dependency set, so the worker keeps it
+# pre-installed and only overlays each app's src/ before `vite build`.
+APP_SCRIPTS = {
+    "dev": "vite",
+    "build": "vite build",
+    "preview": "vite preview"
+}
+APP_DEPENDENCIES = {
+    "react": "^18.2.0",
+    "react-dom": "^18.2.0",
+    "sf-builder-components": "latest",
+    "devspak-s8": "latest"
+}
+APP_DEV_DEPENDENCIES = {
+    "vite": "^5.0.0",
+    "tailwindcss": "^3.3.0",
+    "postcss": "^8.4.0",
+    "autoprefixer": "^10.4.0",
+    "@vitejs/plugin-react": "^4.2.0"
+}
 
-    # Verify ownership
-    project = await db.generated_pages.find_one(
-        {"_id": obj_id, "user_id": str(current_user["_id"])}
-    )
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or not yours")
-
-    temp_dir = tempfile.mkdtemp()
-    src_dir = os.path.join(temp_dir, "src")
-    components_dir = os.path.join(src_dir, "components")
-    pages_dir = os.path.join(src_dir, "pages")
-    public_dir = os.path.join(temp_dir, "public")
-
-    os.makedirs(components_dir, exist_ok=True)
-    os.makedirs(pages_dir, exist_ok=True)
-    os.makedirs(public_dir, exist_ok=True)
-
-    try:
-        # 1. package.json
-        package_json = {
-            "name": f"s8-project-{uuid.uuid4().hex[:6]}",
-            "version": "1.0.0",
-            "private": True,
-            "scripts": {
-                "dev": "vite",
-                "build": "vite build",
-                "preview": "vite preview"
-            },
-            "dependencies": {
-                "react": "^18.2.0",
-                "react-dom": "^18.2.0",
-                "sf-builder-components": "latest",
-                "devspak-s8": "latest"
-            },
-            "devDependencies": {
-                "vite": "^5.0.0",
-                "tailwindcss": "^3.3.0",
-                "postcss": "^8.4.0",
-                "autoprefixer": "^10.4.0",
-                "@vitejs/plugin-react": "^4.2.0"
-            }
-        }
-        with open(os.path.join(temp_dir, "package.json"), "w") as f:
-            json.dump(package_json, f, indent=2)
-
-        # 2. Vite config
-        vite_config = """import { defineConfig } from "vite";
+VITE_CONFIG = """import { defineConfig } from "vite";
 import react from "@vitejs/plugin-react";
 
 export default defineConfig({
+  // Relative asset URLs, so the build works under previews/<id>/ too
+  base: "./",
   plugins: [react()],
 });
 """
-        with open(os.path.join(temp_dir, "vite.config.js"), "w") as f:
-            f.write(vite_config)
 
-        # 3. Tailwind + PostCSS configs
-        tailwind_config = """export default {
+TAILWIND_CONFIG = """export default {
   content: ["./index.html", "./src/**/*.{js,jsx,ts,tsx}"],
   theme: { extend: {} },
   plugins: [],
 };
 """
-        postcss_config = """export default {
+
+POSTCSS_CONFIG = """export default {
   plugins: {
     tailwindcss: {},
     autoprefixer: {},
   },
 };
 """
-        with open(os.path.join(temp_dir, "tailwind.config.js"), "w") as f:
-            f.write(tailwind_config)
-        with open(os.path.join(temp_dir, "postcss.config.js"), "w") as f:
-            f.write(postcss_config)
 
-        # 4. index.html
-        index_html = """<!doctype html>
+INDEX_HTML = """<!doctype html>
 <html lang="en">
   <head>
     <meta charset="UTF-8" />
@@ -115,19 +85,13 @@ export default defineConfig({
   </body>
 </html>
 """
-        with open(os.path.join(temp_dir, "index.html"), "w") as f:
-            f.write(index_html)
 
-        # 5. index.css
-        index_css = """@tailwind base;
+INDEX_CSS = """@tailwind base;
 @tailwind components;
 @tailwind utilities;
 """
-        with open(os.path.join(src_dir, "index.css"), "w") as f:
-            f.write(index_css)
 
-        # 6. main.jsx
-        main_jsx = """import React from "react";
+MAIN_JSX = """import React from "react";
 import ReactDOM from "react-dom/client";
 import App from "./App";
 import "./index.css";
@@ -138,26 +102,56 @@ ReactDOM.createRoot(document.getElementById("root")).render(
   </React.StrictMode>
 );
 """
-        with open(os.path.join(src_dir, "main.jsx"), "w") as f:
-            f.write(main_jsx)
-
-        # 7. Generate Pages + Components
-        pages = project.get("pages", [])
-        app_imports, app_routes = [], []
-
-        for page in pages:
-            page_name = page.get("page_name", "Page").replace(" ", "")
-            page_file = os.path.join(pages_dir, f"{page_name}.jsx")
-            page_imports, page_body = [], []
-
-            for comp in page.get("components", []):
-                variant = comp.get("variant_name") or comp.get("component_name")
-                props_map = comp.get("props", {})
-                props = " ".join([f'{k}="{v}"' for k, v in props_map.items()])
-                page_imports.append(f'import {{ {variant} }} from "sf-builder-components";')
-                page_body.append(f"      <{variant} {props} />")
-
-            code = f"""import React from "react";
+
+# -----------------------------
+# File generation
+# -----------------------------
+def _canonical_hash(value) -> str:
+    canonical = json.dumps(
+        {"generator": GENERATOR_VERSION, "value": value},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def project_hash(project: dict) -> str:
+    """Canonical hash of everything the generated app depends on."""
+    return _canonical_hash(project.get("pages", []))
+
+def file_manifest(files: dict) -> dict:
+    """SHA-256 of each file's content, by relative path."""
+    return {
+        rel_path: hashlib.sha256(content.encode() if isinstance(content, str) else content).hexdigest()
+        for rel_path, content in files.items()
+    }
+
+def build_package_json(name: str) -> dict:
+    return {
+        "name": name,
+        "version": "1.0.0",
+        "private": True,
+        "scripts": APP_SCRIPTS,
+        "dependencies": APP_DEPENDENCIES,
+        "devDependencies": APP_DEV_DEPENDENCIES
+    }
+
+# Rendered page sources keyed on the page's own content hash, so editing
+# one page of a large project only re-renders that page.
+PAGE_CACHE_SIZE = 5000
+_page_cache = OrderedDict()  # page hash -> (page_name, code)
+_page_cache_lock = Lock()
+
+def render_page(page: dict):
+    page_name = page.get("page_name", "Page").replace(" ", "")
+    page_imports, page_body = [], []
+
+    for comp in page.get("components", []):
+        variant = comp.get("variant_name") or comp.get("component_name")
+        props_map = comp.get("props", {})
+        props = " ".join([f'{k}="{v}"' for k, v in props_map.items()])
+        page_imports.append(f'import {{ {variant} }} from "sf-builder-components";')
+        page_body.append(f"      <{variant} {props} />")
+
+    code = f"""import React from "react";
 {os.linesep.join(page_imports)}
 
 export default function {page_name}() {{
@@ -167,14 +161,36 @@ export default function {page_name}() {{
     </div>
   );
 }}"""
-            with open(page_file, "w") as f:
-                f.write(code)
+    return page_name, code
+
+def cached_render_page(page: dict):
+    key = _canonical_hash(page)
+    with _page_cache_lock:
+        hit = _page_cache.get(key)
+        if hit:
+            _page_cache.move_to_end(key)
+            return hit
+
+    rendered = render_page(page)
+    with _page_cache_lock:
+        _page_cache[key] = rendered
+        while len(_page_cache) > PAGE_CACHE_SIZE:
+            _page_cache.popitem(last=False)
+    return rendered
+
+def build_page_files(project: dict) -> dict:
+    """src/pages/*.jsx and src/App.jsx for the project's pages."""
+    files = {}
+    app_imports, app_routes = [], []
+
+    for page in project.get("pages", []):
+        page_name, code = cached_render_page(page)
+        files[f"src/pages/{page_name}.jsx"] = code
 
-            app_imports.append(f'import {page_name} from "./pages/{page_name}";')
-            app_routes.append(f"<{page_name} />")
+        app_imports.append(f'import {page_name} from "./pages/{page_name}";')
+        app_routes.append(f"<{page_name} />")
 
-        # 8. App.jsx
-        app_code = f"""import React from "react";
+    files["src/App.jsx"] = f"""import React from "react";
 {os.linesep.join(app_imports)}
 
 export default function App() {{
@@ -184,28 +200,329 @@ export default function App() {{
     </div>
   );
 }}"""
-        with open(os.path.join(src_dir, "App.jsx"), "w") as f:
-            f.write(app_code)
-
-        # 9. Public placeholder
-        with open(os.path.join(public_dir, "favicon.ico"), "wb") as f:
-            f.write(b"")  # empty placeholder
-
-        # 10. Zip everything
-        zip_name = f"{uuid.uuid4().hex}.zip"
-        zip_path = os.path.join(tempfile.gettempdir(), zip_name)
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(temp_dir):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, temp_dir)
-                    zipf.write(full_path, rel_path)
-
-        return JSONResponse({
-            "status": "success",
-            "message": "Vite + Tailwind app generated successfully",
-            "download_url": f"/downloads/{zip_name}"
-        })
-
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+    return files
+
+def build_app_files(project: dict) -> dict:
+    """Every file of the generated Vite + React + Tailwind app, by relative path."""
+    # Named by content so identical projects produce byte-identical bundles
+    name = f"s8-project-{project_hash(project)[:6]}"
+    return {
+        "package.json": json.dumps(build_package_json(name), indent=2),
+        "vite.config.js": VITE_CONFIG,
+        "tailwind.config.js": TAILWIND_CONFIG,
+        "postcss.config.js": POSTCSS_CONFIG,
+        "index.html": INDEX_HTML,
+        "src/index.css": INDEX_CSS,
+        "src/main.jsx": MAIN_JSX,
+        **build_page_files(project),
+        "public/favicon.ico": b"",  # empty placeholder
+    }
+
+# Fixed entry timestamp, so the same files always zip to the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_DOS_TIME = 0
+ZIP_DOS_DATE = ((ZIP_DATE_TIME[0] - 1980) << 9) | (ZIP_DATE_TIME[1] << 5) | ZIP_DATE_TIME[2]
+
+# Deflated file bodies keyed on their content hash: an unchanged page (or
+# the fixed skeleton) is compressed once and every later bundle or delta
+# is assembled from the cached bytes.
+ENTRY_CACHE_SIZE = 5000
+_entry_cache = OrderedDict()  # content hash -> (crc32, size, deflated bytes)
+_entry_cache_lock = Lock()
+
+def compressed_entry(content) -> tuple:
+    data = content.encode() if isinstance(content, str) else content
+    key = hashlib.sha256(data).hexdigest()
+    with _entry_cache_lock:
+        hit = _entry_cache.get(key)
+        if hit:
+            _entry_cache.move_to_end(key)
+            return hit
+
+    # Raw deflate stream, as stored in a zip entry
+    deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    entry = (zlib.crc32(data), len(data), deflater.compress(data) + deflater.flush())
+    with _entry_cache_lock:
+        _entry_cache[key] = entry
+        while len(_entry_cache) > ENTRY_CACHE_SIZE:
+            _entry_cache.popitem(last=False)
+    return entry
+
+def iter_app_zip(files: dict):
+    """
+    Yield the zip of `files` one entry at a time, built entirely in memory
+    from cached deflated bodies. Bundles are small, so no zip64 records.
+    """
+    central = []
+    offset = 0
+    for rel_path, content in files.items():
+        crc, size, data = compressed_entry(content)
+        name = rel_path.encode()
+        flags = 0 if name.isascii() else 0x800  # UTF-8 names
+        local = struct.pack(
+            "<4s5H3L2H", b"PK\x03\x04", 20, flags, zipfile.ZIP_DEFLATED,
+            ZIP_DOS_TIME, ZIP_DOS_DATE, crc, len(data), size, len(name), 0
+        )
+        central.append(struct.pack(
+            "<4s6H3L5H2L", b"PK\x01\x02", (3 << 8) | 20, 20, flags, zipfile.ZIP_DEFLATED,
+            ZIP_DOS_TIME, ZIP_DOS_DATE, crc, len(data), size, len(name), 0, 0, 0, 0,
+            0o644 << 16, offset
+        ) + name)
+        yield local + name + data
+        offset += len(local) + len(name) + len(data)
+
+    directory = b"".join(central)
+    yield directory + struct.pack(
+        "<4s4H2LH", b"PK\x05\x06", 0, 0, len(central), len(central), len(directory), offset, 0
+    )
+
+async def record_manifest(key: str, files: dict):
+    """Remember which files a bundle contains, so later deltas can be taken against it."""
+    await db.generated_bundle_manifests.update_one(
+        {"_id": key},
+        {"$setOnInsert": {"files": file_manifest(files), "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def bundle_artifact_name(key: str) -> str:
+    return f"bundle-{key}.zip"
+
+def iter_and_store(key: str, chunks):
+    """Pass chunks through, storing the whole bundle once the last one is sent."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    artifact_store.put(bundle_artifact_name(key), b"".join(parts), "application/zip", etag=key)
+
+def upload_app_zip(project: dict, s3_key: str):
+    """Blocking: zip the app in memory and upload it for the worker."""
+    buffer = io.BytesIO(b"".join(iter_app_zip(build_app_files(project))))
+    s3_client.upload_fileobj(buffer, settings.BUCKET_NAME, s3_key)
+
+def generated_preview_url(request: Request, route_name: str, project_id: str) -> str:
+    """Preview link carrying a token scoped to the project, since iframes can't send an auth header."""
+    url = request.url_for(route_name, project_id=project_id)
+    return str(url.include_query_params(token=create_preview_token(f"generated:{project_id}")))
+
+async def get_owned_project(project_id: str, current_user: dict) -> dict:
+    if not project_id:
+        raise HTTPException(status_code=400, detail="project_id is required")
+
+    try:
+        obj_id = ObjectId(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id")
+
+    # Verify ownership
+    project = await db.generated_pages.find_one(
+        {"_id": obj_id, "user_id": str(current_user["_id"])}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found or not yours")
+    return project
+
+# -----------------------------
+# Routes
+# -----------------------------
+@router.post("/")
+async def generate_app(
+    request: Request,
+    data: dict = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Generate a Vite + React + Tailwind app for a given project and stream
+    it back as a zip. Bundles are stored in the artifact store by
+    project_hash, so an unchanged project is served straight from it. A
+    miss is built in memory; the sync generator is iterated in Starlette's
+    threadpool, so deflating never blocks the event loop.
+    Content-Location points at the stored copy under /downloads, which
+    supports Range and If-None-Match for resuming and re-downloading.
+    Body: { "project_id": "<id>" }
+    """
+    project = await get_owned_project(data.get("project_id"), current_user)
+
+    key = project_hash(project)
+    name = bundle_artifact_name(key)
+    zip_name = f"s8-project-{project['_id']}.zip"
+    headers = {"Content-Location": f"/downloads/{name}"}
+
+    artifact = await run_in_threadpool(artifact_store.stat, name)
+    if artifact:
+        return serve_artifact(request, artifact, zip_name, {**headers, "X-Bundle-Cache": "hit"})
+
+    files = build_app_files(project)
+    await record_manifest(key, files)
+    return StreamingResponse(
+        iter_and_store(key, iter_app_zip(files)),
+        media_type="application/zip",
+        headers={
+            **headers,
+            "ETag": f'"{key}"',
+            "X-Bundle-Cache": "miss",
+            "Content-Disposition": f'attachment; filename="{zip_name}"'
+        }
+    )
+
+@router.post("/delta")
+async def generate_app_delta(
+    data: dict = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Zip of only the files that changed since a bundle the client already
+    has (the ETag of an earlier download). `.s8-delta.json` in the zip
+    lists the deleted files. Falls back to the full bundle if the base is
+    unknown (X-Delta: full), and returns 204 if nothing changed.
+    Body: { "project_id": "<id>", "since": "<bundle hash>" }
+    """
+    project = await get_owned_project(data.get("project_id"), current_user)
+    since = (data.get("since") or "").strip('"')
+
+    key = project_hash(project)
+    if since == key:
+        return Response(status_code=204, headers={"ETag": f'"{key}"'})
+
+    files = build_app_files(project)
+    await record_manifest(key, files)
+    base = await db.generated_bundle_manifests.find_one({"_id": since}) if since else None
+
+    zip_name = f"s8-project-{project['_id']}"
+    headers = {"ETag": f'"{key}"'}
+    if not base:
+        return StreamingResponse(
+            iter_app_zip(files),
+            media_type="application/zip",
+            headers={**headers, "X-Delta": "full", "Content-Disposition": f'attachment; filename="{zip_name}.zip"'}
+        )
+
+    old, new = base["files"], file_manifest(files)
+    delta = {rel_path: files[rel_path] for rel_path, digest in new.items() if old.get(rel_path) != digest}
+    delta[".s8-delta.json"] = json.dumps({
+        "base": since,
+        "target": key,
+        "deleted": sorted(rel_path for rel_path in old if rel_path not in new)
+    }, indent=2)
+
+    return StreamingResponse(
+        iter_app_zip(delta),
+        media_type="application/zip",
+        headers={**headers, "X-Delta": "partial", "Content-Disposition": f'attachment; filename="{zip_name}-delta.zip"'}
+    )
+
+@router.post("/preview")
+async def preview_app(
+    request: Request,
+    data: dict = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a hosted preview build of a generated app. The worker builds it
+    on its pre-installed base and publishes it like a template preview.
+    Body: { "project_id": "<id>" }
+    """
+    project = await get_owned_project(data.get("project_id"), current_user)
+    project_id = str(project["_id"])
+
+    s3_key = f"generated/{project_id}/{uuid.uuid4().hex}.zip"
+    await run_in_threadpool(upload_app_zip, project, s3_key)
+
+    await db.generated_pages.update_one(
+        {"_id": project["_id"]},
+        {"$set": {"preview_status": "pending", "source_s3_key": s3_key}}
+    )
+    push_generated_app_task(project_id, s3_key)
+
+    return {
+        "status": "pending",
+        "preview_url": generated_preview_url(request, "generated_app_preview", project_id),
+        "static_preview_url": generated_preview_url(request, "generated_app_static_preview", project_id)
+    }
+
+@router.post("/preview/static")
+async def static_preview_link(
+    request: Request,
+    data: dict = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Link to the instant static HTML preview of a saved project. Nothing is
+    built, so it can be fetched right after every save.
+    Body: { "project_id": "<id>" }
+    """
+    project = await get_owned_project(data.get("project_id"), current_user)
+    project_id = str(project["_id"])
+    return {"preview_url": generated_preview_url(request, "generated_app_static_preview", project_id)}
+
+@router.get("/preview/{project_id}", name="generated_app_preview")
+async def generated_app_preview(project_id: str, token: str = Query(None)):
+    """
+    Redirect to the built preview once it is ready; until then report the
+    build status. Authorised by the link's preview token rather than an
+    auth header, so it works in an iframe.
+    """
+    try:
+        obj_id = ObjectId(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id")
+    if not token:
+        raise HTTPException(status_code=401, detail="Preview token required")
+    verify_preview_token(token, f"generated:{project_id}")
+
+    project = await db.generated_pages.find_one(
+        {"_id": obj_id}, {"preview_status": 1, "preview_key": 1}
+    )
+    if not project or not project.get("preview_status"):
+        raise HTTPException(status_code=404, detail="No preview requested for this project")
+
+    if project["preview_status"] == "error":
+        raise HTTPException(status_code=422, detail="Preview build failed")
+    if project["preview_status"] == "ready" and project.get("preview_key"):
+        return RedirectResponse(get_presigned_url(project["preview_key"]), status_code=307)
+    return JSONResponse({"status": project["preview_status"]}, status_code=202)
+
+@router.get("/preview/{project_id}/static", name="generated_app_static_preview")
+@router.get("/preview/{project_id}/static/{page_name}", name="generated_app_static_page")
+async def generated_app_static_preview(
+    request: Request,
+    project_id: str,
+    page_name: Optional[str] = None,
+    token: str = Query(None)
+):
+    """
+    Instant preview of the saved project as static HTML, rendered from
+    precompiled catalog fragments (no npm or vite build). Shows the first
+    page unless page_name is given. Authorised by the link's preview token
+    rather than an auth header, so it works in an iframe.
+    """
+    try:
+        obj_id = ObjectId(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid project_id")
+    if not token:
+        raise HTTPException(status_code=401, detail="Preview token required")
+    verify_preview_token(token, f"generated:{project_id}")
+
+    project = await db.generated_pages.find_one({"_id": obj_id}, {"pages": 1})
+    pages = (project or {}).get("pages") or []
+    if not pages:
+        raise HTTPException(status_code=404, detail="Project not found or has no pages")
+
+    names = [page_name_of(page) for page in pages]
+    if page_name is not None and page_name not in names:
+        raise HTTPException(status_code=404, detail="Page not found")
+    index = names.index(page_name) if page_name is not None else 0
+
+    # Nav links carry the same token, so every page of the preview opens
+    page_urls = [
+        str(request.url_for("generated_app_static_page", project_id=project_id, page_name=name)
+            .include_query_params(token=token))
+        for name in names
+    ]
+    html, etag = render_preview(pages, index, page_urls)
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
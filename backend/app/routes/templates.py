@@ -2,13 +2,18 @@
 import os
 import aiofiles
 from uuid import uuid4
-from fastapi import APIRouter, UploadFile, Form, File, Depends, HTTPException, Path
+from fastapi import APIRouter, UploadFile, Form, File, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import boto3
 from bson import ObjectId
 
 from s8.core.config import settings
 from app.aws_client import push_template_task
+from app.utils.zip_utils import detect_zip_framework
+from app.utils.presign_utils import get_presigned_url
+from app.utils.auth_utils import create_preview_token, verify_preview_token
 from s8.service.template_service import create_template_record
 from app.models.template import Template
 from s8.db.database import template_collection
@@ -61,6 +66,10 @@ async def upload_template(
     if not zip_file.filename.endswith(".zip"):
         raise HTTPException(status_code=400, detail="Only ZIP files allowed.")
 
+    # Detect framework so static templates can take the fast build lane
+    framework = await run_in_threadpool(detect_zip_framework, await zip_file.read())
+    await zip_file.seek(0)
+
     # Upload ZIP
     zip_key, zip_url = await upload_file_to_s3(zip_file)
 
@@ -80,6 +89,7 @@ async def upload_template(
         images=image_urls,
         uploaded_by=str(current_user["_id"]),  # 👈 real user ID from auth
         status="pending",
+        framework=framework,
         is_public=False  # enforce private
     )
 
@@ -87,7 +97,7 @@ async def upload_template(
     template_id = await create_template_record(template.dict())
 
     # Push to SQS
-    push_template_task(template_id, template.zip_s3_key)
+    push_template_task(template_id, template.zip_s3_key, template.framework)
 
     return {
         "message": "Template uploaded successfully.",
@@ -96,19 +106,64 @@ async def upload_template(
         "image_urls": image_urls
     }
 
+# -----------------------------
+# Preview
+# -----------------------------
+def preview_key_for(template: dict):
+    if template.get("preview_key"):
+        return template["preview_key"]
+    # Templates built before preview_key was stored
+    if template.get("status") == "ready":
+        return f"previews/{template['_id']}/index.html"
+    return None
+
+def stable_preview_url(request: Request, template: dict):
+    if not preview_key_for(template):
+        return None
+    template_id = str(template["_id"])
+    url = request.url_for("template_preview", template_id=template_id)
+    return str(url.include_query_params(token=create_preview_token(f"template:{template_id}")))
+
+@template_router.get("/{template_id}/preview", name="template_preview")
+async def template_preview(template_id: str = Path(...), token: str = Query(None)):
+    """
+    Redirect to a freshly presigned URL for the template's preview. The
+    link carries a preview token minted for the owner (iframes can't send
+    an auth header), and the owner's template listings hand out fresh ones.
+    Public templates need no token.
+    """
+    try:
+        obj_id = ObjectId(template_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid template_id")
+
+    template = await template_collection.find_one({"_id": obj_id}, {"preview_key": 1, "status": 1, "is_public": 1})
+    if template and not template.get("is_public"):
+        if not token:
+            raise HTTPException(status_code=401, detail="Preview token required")
+        verify_preview_token(token, f"template:{template_id}")
+    key = preview_key_for(template) if template else None
+    if not key:
+        raise HTTPException(status_code=404, detail="Preview not ready")
+
+    return RedirectResponse(get_presigned_url(key), status_code=307)
+
 # -----------------------------
 # Get current user's templates
 # -----------------------------
 @template_router.get("/my-templates")
-async def get_my_templates(current_user: dict = Depends(get_current_user)):
+async def get_my_templates(request: Request, current_user: dict = Depends(get_current_user)):
     user_id = str(current_user["_id"])
     templates_cursor = template_collection.find({"uploaded_by": user_id}).sort("created_at", -1)
     templates = await templates_cursor.to_list(length=100)
+    for template in templates:
+        template["preview_url"] = stable_preview_url(request, template)
     return serialize_list(templates)
 
 
 @template_router.get("/my-templates/{template_id}")
 async def get_my_template_by_id(
+    request: Request,
     template_id: str = Path(...),
     current_user: dict = Depends(get_current_user)
 ):
@@ -121,10 +176,15 @@ async def get_my_template_by_id(
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
+    # Stable preview link (None while still processing)
+    template["preview_url"] = stable_preview_url(request, template)
+
+    # Set by the worker while the template waits for a build slot
+    waiting = template.get("status") == "pending"
+    template["queue_position"] = template.get("queue_position") if waiting else None
+    template["estimated_start_at"] = template.get("estimated_start_at") if waiting else None
+
     # Convert ObjectId to string for frontend
     template["_id"] = str(template["_id"])
 
-    # Ensure preview_url is included even if not yet processed
-    template["preview_url"] = template.get("preview_url")  # could be None if still processing
-
     return template
\ No newline at end of file
@@ -0,0 +1,218 @@
+# app/utils/artifact_store.py
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from threading import Lock
+from typing import Iterator, Optional
+from botocore.exceptions import ClientError
+from s8.core.config import settings
+
+ARTIFACT_STORE = getattr(settings, "ARTIFACT_STORE", "local")
+ARTIFACT_DIR = getattr(settings, "ARTIFACT_DIR", None) or os.path.join(tempfile.gettempdir(), "s8_artifacts")
+ARTIFACT_S3_PREFIX = getattr(settings, "ARTIFACT_S3_PREFIX", "artifacts/")
+ARTIFACT_MAX_BYTES = int(getattr(settings, "ARTIFACT_MAX_BYTES", 512 * 1024 * 1024))
+ARTIFACT_TTL_SECONDS = int(getattr(settings, "ARTIFACT_TTL_SECONDS", 7 * 24 * 3600))
+ARTIFACT_SWEEP_INTERVAL = int(getattr(settings, "ARTIFACT_SWEEP_INTERVAL", 600))
+
+# Flat names only, so a name can never point outside the store
+ARTIFACT_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+CHUNK_SIZE = 64 * 1024
+
+@dataclass
+class Artifact:
+    name: str
+    size: int
+    etag: str  # quoted, ready for the ETag header
+    content_type: str
+
+def check_name(name: str):
+    # ".meta" is reserved for the local store's sidecar files
+    if not ARTIFACT_NAME_RE.fullmatch(name) or name.endswith(".meta"):
+        raise ValueError(f"Invalid artifact name: {name}")
+
+class LocalArtifactStore:
+    """
+    Artifacts on local disk, with a JSON sidecar holding the ETag and
+    content type. A file's mtime is its last use: stat() refreshes it,
+    artifacts unused for longer than the TTL expire, and the least
+    recently used are evicted once the store exceeds its byte budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = Lock()
+
+    def _path(self, name: str) -> str:
+        check_name(name)
+        return os.path.join(self.directory, name)
+
+    def put(self, name: str, data: bytes, content_type: str = "application/octet-stream",
+            etag: Optional[str] = None) -> Artifact:
+        """`etag` (unquoted) overrides the default content hash, e.g. for content-addressed names."""
+        path = self._path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        etag = etag or hashlib.sha256(data).hexdigest()[:32]
+        artifact = Artifact(name, len(data), f'"{etag}"', content_type)
+        # Write under unique names and rename, so readers never see a partial file
+        for target, content in (
+            (f"{path}.meta", json.dumps({"etag": artifact.etag, "content_type": content_type}).encode()),
+            (path, data),
+        ):
+            fd, tmp = tempfile.mkstemp(prefix=f".{name}.", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, target)
+        self.sweep()
+        return artifact
+
+    def stat(self, name: str) -> Optional[Artifact]:
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+            if time.time() - st.st_mtime > self.ttl_seconds:
+                self.delete(name)
+                return None
+            with open(f"{path}.meta") as f:
+                meta = json.load(f)
+            os.utime(path, None)
+        except (FileNotFoundError, ValueError):
+            return None
+        return Artifact(name, st.st_size, meta["etag"], meta["content_type"])
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        """Bytes start..end inclusive."""
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str):
+        path = self._path(name)
+        for target in (path, f"{path}.meta"):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self) -> int:
+        """Drop expired artifacts, then the least recently used until within budget."""
+        if not os.path.isdir(self.directory):
+            return 0
+        removed = 0
+        with self.lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.startswith("."):
+                    # Leftover temp file from a crashed write
+                    if st.st_mtime < now - 3600:
+                        os.remove(path)
+                    continue
+                if name.endswith(".meta"):
+                    continue
+                if now - st.st_mtime > self.ttl_seconds:
+                    self.delete(name)
+                    removed += 1
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self.delete(name)
+                removed += 1
+                total -= size
+        return removed
+
+class S3ArtifactStore:
+    """
+    Artifacts under a prefix of the app bucket. S3 can't cheaply record
+    reads, so the TTL counts from upload; the bucket's own storage is the
+    budget.
+    """
+
+    def __init__(self, s3_client, bucket: str, prefix: str, ttl_seconds: int):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, name: str) -> str:
+        check_name(name)
+        return f"{self.prefix}{name}"
+
+    def put(self, name: str, data: bytes, content_type: str = "application/octet-stream",
+            etag: Optional[str] = None) -> Artifact:
+        resp = self.s3_client.put_object(
+            Bucket=self.bucket, Key=self._key(name), Body=data, ContentType=content_type,
+            Metadata={"etag": etag} if etag else {},
+        )
+        return Artifact(name, len(data), f'"{etag}"' if etag else resp["ETag"], content_type)
+
+    def stat(self, name: str) -> Optional[Artifact]:
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError:
+            return None
+        if time.time() - head["LastModified"].timestamp() > self.ttl_seconds:
+            self.delete(name)
+            return None
+        etag = head.get("Metadata", {}).get("etag")
+        return Artifact(
+            name, head["ContentLength"], f'"{etag}"' if etag else head["ETag"],
+            head.get("ContentType", "application/octet-stream"),
+        )
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        obj = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(name), Range=f"bytes={start}-{end}")
+        yield from obj["Body"].iter_chunks(CHUNK_SIZE)
+
+    def delete(self, name: str):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        expired = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            expired += [{"Key": o["Key"]} for o in page.get("Contents", []) if o["LastModified"].timestamp() < cutoff]
+        for i in range(0, len(expired), 1000):
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": expired[i:i + 1000], "Quiet": True})
+        return len(expired)
+
+def create_artifact_store():
+    if ARTIFACT_STORE == "s3":
+        from app.aws_client import s3_client
+        return S3ArtifactStore(s3_client, settings.BUCKET_NAME, ARTIFACT_S3_PREFIX, ARTIFACT_TTL_SECONDS)
+    return LocalArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES, ARTIFACT_TTL_SECONDS)
+
+artifact_store = create_artifact_store()
+
+async def sweep_artifacts_forever():
+    while True:
+        try:
+            removed = await asyncio.to_thread(artifact_store.sweep)
+            if removed:
+                logging.info("Artifact sweeper removed %d artifact(s)", removed)
+        except Exception as e:
+            logging.error("Artifact sweep failed: %s", e)
+        await asyncio.sleep(ARTIFACT_SWEEP_INTERVAL)
@@ -36,3 +36,18 @@ def decode_token(token: str, expected_type: str = "access"):
     except jwt.InvalidTokenError as e:
         print("Invalid token:", e)
         raise HTTPException(status_code=401, detail="Invalid token")
+
+# Preview links are opened in iframes, which can't send an auth header,
+# so they carry a short-lived token scoped to the one resource instead.
+PREVIEW_TOKEN_HOURS = int(getattr(settings, "PREVIEW_TOKEN_HOURS", 24))
+
+def create_preview_token(resource: str, expires_delta: timedelta = timedelta(hours=PREVIEW_TOKEN_HOURS)):
+    expire = datetime.utcnow() + expires_delta
+    return jwt.encode(
+        {"sub": resource, "exp": expire, "type": "preview"},
+        settings.JWT_SECRET_KEY, algorithm=settings.ALGORITHM
+    )
+
+def verify_preview_token(token: str, resource: str):
+    if decode_token(token, expected_type="preview").get("sub") != resource:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Preview token is not valid for this resource")
@@ -0,0 +1,38 @@
+# app/utils/presign_utils.py
+import time
+from collections import OrderedDict
+from threading import Lock
+from s8.core.config import settings
+from app.aws_client import s3_client
+
+PRESIGN_EXPIRES = 3600
+# Hand out cached URLs only while they have at least this long left to live
+PRESIGN_MIN_REMAINING = 300
+PRESIGN_CACHE_SIZE = 10_000
+
+_cache: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+_lock = Lock()
+
+def get_presigned_url(key: str) -> str:
+    """
+    Presigned GET URL for an S3 key, cached in-process (LRU, TTL bound to
+    the URL's own expiry) so hot previews don't re-sign on every hit.
+    """
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(key)
+        if hit and hit[1] - now > PRESIGN_MIN_REMAINING:
+            _cache.move_to_end(key)
+            return hit[0]
+
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": settings.BUCKET_NAME, "Key": key},
+        ExpiresIn=PRESIGN_EXPIRES,
+    )
+    with _lock:
+        _cache[key] = (url, now + PRESIGN_EXPIRES)
+        _cache.move_to_end(key)
+        while len(_cache) > PRESIGN_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return url
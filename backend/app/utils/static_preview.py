@@ -0,0 +1,256 @@
+# app/utils/static_preview.py
+import re
+import json
+import hashlib
+from html import escape
+from string import Template
+from collections import OrderedDict
+from threading import Lock
+from app.seeds.seed_components import COMPONENTS
+
+# Part of every cache key: bump it whenever rendered output changes
+RENDERER_VERSION = "1"
+PREVIEW_CACHE_SIZE = 5000
+
+# -----------------------------
+# Fragments
+# -----------------------------
+# One fragment per catalog component. $variant and $layout are filled in
+# once per variant at import; every other $slot is a prop, rendered to
+# HTML by render_prop, and $extra holds any props the fragment doesn't name.
+HERO = """<section class="s8-hero $variant"$gradient>$image$video_url<div class="s8-hero-body">$title$subtitle$description$split_text$overlay_text$extra</div></section>"""
+SECTION = """<section class="s8-section $variant">$title$text$extra</section>"""
+COLLECTION = """<section class="s8-section $variant">$title<div class="s8-items s8-$layout">$items</div>$extra</section>"""
+FOOTER = """<footer class="s8-footer $variant">$newsletter_text$columns$social_links$extra<p class="s8-muted">Built with S8</p></footer>"""
+
+COMPONENT_FRAGMENTS = {
+    "HeroSection": HERO,
+    "Footer": FOOTER,
+    "PortfolioHero": HERO,
+    "PortfolioAbout": """<section class="s8-section s8-about $variant">$image$caption$text$timeline_events$stats$extra</section>""",
+    "PortfolioProjects": COLLECTION.replace("$items", "$projects"),
+    "PortfolioSkills": COLLECTION.replace("$items", "$skills$icons$animations"),
+    "PortfolioTestimonials": COLLECTION.replace("$items", "$quote$author$testimonials"),
+    "PortfolioContact": """<section class="s8-section $variant">$title$fields$map_location$style$extra</section>""",
+    "PortfolioFooter": FOOTER,
+    "LandingHero": HERO,
+    "LandingFeatures": COLLECTION.replace("$items", "$features$icons$animations"),
+    "LandingPricing": COLLECTION.replace("$items", "$plans$tiers$comparison_table"),
+    "LandingCTA": """<section class="s8-cta $variant">$cta_text$cta_link$extra</section>""",
+    "LandingTestimonials": COLLECTION.replace("$items", "$testimonials"),
+    "LandingFooter": FOOTER,
+    "ProductGrid": COLLECTION.replace("$items", "$products"),
+    "ProductDetail": """<section class="s8-section $variant">$product$images$tabs$extra</section>""",
+    "Cart": """<section class="s8-section $variant">$title$cart_items$totals$side_layout$extra</section>""",
+    "Checkout": """<section class="s8-section $variant">$title$checkout_steps$checkout_fields$extra</section>""",
+    "EcommerceFooter": FOOTER,
+    "BlogPostList": COLLECTION.replace("$items", "$posts"),
+    "BlogPostDetail": SECTION.replace("$text", "$post"),
+    "AuthorBio": SECTION.replace("$text", "$author_info"),
+    "CustomComponent": SECTION.replace("$text", "$custom_fields"),
+}
+
+# Unknown components still show up, with whatever props they were given
+UNKNOWN_FRAGMENT = """<section class="s8-section s8-unknown" data-component="$variant">$title$extra</section>"""
+
+def layout_for(variant_name: str) -> str:
+    for word, layout in (("Carousel", "row"), ("Slider", "row"), ("Masonry", "masonry"), ("Grid", "grid")):
+        if word in variant_name:
+            return layout
+    return "grid"
+
+class Fragment:
+    """A catalog fragment with its per-variant parts already substituted."""
+
+    def __init__(self, source: str, variant: str):
+        # "$$" keeps a "$" in the name from being read as a slot
+        compiled = Template(source).safe_substitute(variant=variant.replace("$", "$$"), layout=layout_for(variant))
+        self.template = Template(compiled)
+        self.slots = frozenset(self.template.get_identifiers()) - {"extra"}
+
+    def render(self, props: dict) -> str:
+        values = {slot: render_prop(slot, props.get(slot)) for slot in self.slots}
+        values["extra"] = "".join(
+            render_prop(name, value) for name, value in props.items() if name not in self.slots
+        )
+        return self.template.substitute(values)
+
+# variant name -> Fragment, compiled once from the seeded catalog
+VARIANT_FRAGMENTS = {
+    variant["name"]: Fragment(COMPONENT_FRAGMENTS[component["name"]], variant["name"])
+    for component in COMPONENTS
+    for variant in component["variants"]
+}
+# Pages may also name the component itself rather than a variant
+VARIANT_FRAGMENTS.update({
+    component["name"]: Fragment(COMPONENT_FRAGMENTS[component["name"]], component["name"])
+    for component in COMPONENTS
+})
+
+# -----------------------------
+# Props
+# -----------------------------
+SAFE_URL_RE = re.compile(r"(https?:|mailto:|tel:|/|#)", re.I)
+SAFE_CSS_RE = re.compile(r"[\w\s#%.,()-]+")
+HEADING_PROPS = ("title", "name", "heading", "label", "plan")
+
+def safe_url(value) -> str:
+    value = str(value).strip()
+    return escape(value) if SAFE_URL_RE.match(value) else "#"
+
+def label_for(name: str) -> str:
+    return escape(name.replace("_", " ").capitalize())
+
+def render_fields(fields) -> str:
+    """Form inputs; each field is a name or {name, label, type}."""
+    inputs = []
+    for field in fields if isinstance(fields, list) else [fields]:
+        if isinstance(field, dict):
+            name = str(field.get("name") or field.get("label") or "field")
+            label, kind = str(field.get("label") or name), str(field.get("type") or "text")
+        else:
+            name = label = str(field)
+            kind = "email" if "mail" in name.lower() else "text"
+        control = (
+            f'<textarea name="{escape(name)}"></textarea>' if kind == "textarea"
+            else f'<input type="{escape(kind)}" name="{escape(name)}">'
+        )
+        inputs.append(f"<label>{escape(label)}{control}</label>")
+    return f'<form class="s8-form" onsubmit="return false">{"".join(inputs)}<button type="button">Send</button></form>'
+
+def render_item(item) -> str:
+    """One entry of a list prop: a card for dicts, a tile for anything else."""
+    if not isinstance(item, dict):
+        return f'<div class="s8-card">{render_value(item)}</div>'
+    parts = [render_prop(key, item.get(key)) for key in ("image", "icon")]
+    heading = next((key for key in HEADING_PROPS if item.get(key)), None)
+    if heading:
+        parts.append(f"<h3>{escape(str(item[heading]))}</h3>")
+    parts += [
+        render_prop(key, value) for key, value in item.items()
+        if key not in ("image", "icon", heading)
+    ]
+    return f'<div class="s8-card">{"".join(parts)}</div>'
+
+def render_value(value) -> str:
+    if isinstance(value, list):
+        return "".join(render_item(item) for item in value)
+    if isinstance(value, dict):
+        return render_item(value)
+    return escape(str(value))
+
+def render_prop(name: str, value) -> str:
+    if value is None or value == "" or value == [] or value == {}:
+        return ""
+    if name in ("image", "images"):
+        sources = value if isinstance(value, list) else [value]
+        return "".join(f'<img src="{safe_url(src)}" alt="" loading="lazy">' for src in sources if not isinstance(src, dict))
+    if name == "icon":
+        return f'<span class="s8-icon">{escape(str(value))}</span>'
+    if name == "video_url":
+        return f'<video src="{safe_url(value)}" controls muted></video>'
+    if name == "gradient":
+        css = str(value)
+        return f' style="background:{escape(css)}"' if SAFE_CSS_RE.fullmatch(css) else ""
+    if name in ("fields", "checkout_fields"):
+        return render_fields(value)
+    if name in ("cta_link", "url", "link", "href"):
+        return f'<a class="s8-button" href="{safe_url(value)}">{escape(str(value)) if name != "cta_link" else "Get started"}</a>'
+    if name == "title":
+        return f"<h2>{escape(str(value))}</h2>"
+    if isinstance(value, (list, dict)):
+        return f'<div class="s8-prop" data-prop="{escape(name)}">{render_value(value)}</div>'
+    if name in ("subtitle", "description", "text", "quote", "caption", "cta_text", "overlay_text", "split_text", "newsletter_text"):
+        return f'<p class="s8-{escape(name)}">{escape(str(value))}</p>'
+    return f'<p><strong>{label_for(name)}:</strong> {escape(str(value))}</p>'
+
+# -----------------------------
+# Pages
+# -----------------------------
+PREVIEW_CSS = """*{box-sizing:border-box}body{margin:0;font:16px/1.5 system-ui,sans-serif;color:#111827;background:#f9fafb}
+main{max-width:1100px;margin:0 auto;padding:24px}nav{display:flex;gap:16px;padding:12px 24px;background:#111827}
+nav a{color:#e5e7eb;text-decoration:none}nav a[aria-current]{color:#fff;font-weight:600}
+section,footer{margin:0 0 24px;padding:32px;border-radius:12px;background:#fff;box-shadow:0 1px 2px rgba(0,0,0,.06)}
+.s8-hero{text-align:center;padding:64px 32px;background:linear-gradient(135deg,#eef2ff,#fdf2f8)}
+.s8-hero h2{font-size:2.5rem;margin:0 0 8px}.s8-hero img,.s8-hero video{max-width:100%;border-radius:8px}
+img{max-width:100%;height:auto}.s8-items{gap:16px}.s8-grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(220px,1fr))}
+.s8-row{display:flex;overflow-x:auto}.s8-row>*{flex:0 0 260px}.s8-masonry{columns:3 220px}.s8-masonry>*{break-inside:avoid;margin-bottom:16px}
+.s8-prop{display:grid;gap:16px}.s8-items>.s8-prop{display:contents}
+.s8-card{padding:16px;border:1px solid #e5e7eb;border-radius:8px;background:#fff}.s8-card h3{margin:0 0 8px}
+.s8-cta{text-align:center;background:#4f46e5;color:#fff}.s8-button{display:inline-block;padding:10px 20px;border-radius:8px;background:#111827;color:#fff;text-decoration:none}
+.s8-form{display:grid;gap:12px;max-width:480px}.s8-form input,.s8-form textarea{display:block;width:100%;padding:8px;border:1px solid #d1d5db;border-radius:6px}
+.s8-footer{background:#111827;color:#e5e7eb}.s8-muted{opacity:.6;font-size:.875rem}.s8-unknown{border:2px dashed #f59e0b}"""
+
+DOCUMENT = Template("""<!doctype html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>$title</title>
+<style>$css</style>
+</head>
+<body>$nav<main>$body</main></body>
+</html>""")
+
+def page_name_of(page: dict) -> str:
+    # Same naming as the generated App's pages/*.jsx
+    return page.get("page_name", "Page").replace(" ", "")
+
+def page_hash(page: dict) -> str:
+    canonical = json.dumps(
+        {"renderer": RENDERER_VERSION, "page": page},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def render_component(comp: dict) -> str:
+    name = comp.get("variant_name") or comp.get("component_name") or "Component"
+    fragment = VARIANT_FRAGMENTS.get(name) or VARIANT_FRAGMENTS.get(comp.get("component_name"))
+    props = comp.get("props") or {}
+    if fragment is None:
+        fragment = Fragment(UNKNOWN_FRAGMENT, escape(name))
+    return fragment.render(props if isinstance(props, dict) else {})
+
+def render_page_body(page: dict) -> str:
+    return "".join(render_component(comp) for comp in page.get("components", []))
+
+# Rendered page bodies keyed on the page's content hash, so a preview is a
+# lookup plus a string join, and editing one page only re-renders that page.
+_cache = OrderedDict()  # page hash -> body html
+_lock = Lock()
+
+def cached_page_body(key: str, page: dict) -> str:
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+
+    body = render_page_body(page)
+    with _lock:
+        _cache[key] = body
+        while len(_cache) > PREVIEW_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return body
+
+def render_preview(pages: list, index: int, page_urls: list) -> tuple:
+    """
+    Static HTML document for pages[index], with a nav linking every page
+    when there is more than one. Returns (html, etag).
+    """
+    page = pages[index]
+    key = page_hash(page)
+    names = [page_name_of(p) for p in pages]
+
+    nav = ""
+    if len(pages) > 1:
+        nav = "<nav>" + "".join(
+            f'<a href="{escape(url)}"{" aria-current=page" if i == index else ""}>{escape(name)}</a>'
+            for i, (name, url) in enumerate(zip(names, page_urls))
+        ) + "</nav>"
+
+    html = DOCUMENT.substitute(
+        title=escape(names[index]), css=PREVIEW_CSS, nav=nav, body=cached_page_body(key, page)
+    )
+    etag = hashlib.sha256(f"{key}:{index}:{json.dumps(list(zip(names, page_urls)))}".encode()).hexdigest()[:32]
+    return html, f'"{etag}"'
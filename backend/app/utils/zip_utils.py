@@ -0,0 +1,55 @@
+# app/utils/zip_utils.py
+import io
+import json
+import zipfile
+from typing import Optional
+
+# Frameworks the worker can publish without an npm build
+STATIC_FRAMEWORKS = ("plain",)
+
+def _root_prefix(names: list) -> str:
+    # Same single-top-level-folder rule the worker applies after extraction
+    tops = {n.split("/", 1)[0] for n in names if n and not n.startswith(".")}
+    if len(tops) == 1:
+        top = tops.pop()
+        if any(n.startswith(f"{top}/") for n in names):
+            return f"{top}/"
+    return ""
+
+def detect_zip_framework(data: bytes) -> Optional[str]:
+    """
+    Classify a template zip from its package.json, mirroring the worker's
+    detect_framework. Returns None if the archive can't be read. Blocking;
+    call it from a threadpool.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        return None
+
+    names = zf.namelist()
+    prefix = _root_prefix(names)
+    pkg = None
+    if f"{prefix}package.json" in names:
+        try:
+            pkg = json.loads(zf.read(f"{prefix}package.json"))
+        except Exception:
+            pkg = None
+    if not pkg or not isinstance(pkg, dict):
+        return "plain"
+
+    # Like npm, ignore dependency fields that aren't objects (e.g. null)
+    deps = {}
+    for field in ("dependencies", "devDependencies"):
+        if isinstance(pkg.get(field), dict):
+            deps.update(pkg[field])
+    if "next" in deps:
+        return "next"
+    if "vite" in deps:
+        return "vite"
+    if "react" in deps:
+        return "cra"
+    for guess in ("dist", "build", "out"):
+        if any(n.startswith(f"{prefix}{guess}/") for n in names):
+            return "unknown"
+    return "plain"
@@ -1,17 +1,36 @@
 # app/worker.py
 import os
 import json
+import math
+import gzip
+import hashlib
+import io
+import functools
+import mimetypes
+import re
 import shutil
 import tempfile
 import subprocess
 import signal
+import socket
 import sys
+import time
+import zipfile
+from datetime import datetime, timedelta
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
 from typing import Optional, Tuple
 import asyncio
+import contextlib
 
 import psutil
 import aioboto3
+from aiohttp import web
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 
 from s8.core.config import settings
 from s8.service.template_service import update_template_status
@@ -22,10 +41,23 @@ from s8.service.template_service import update_template_status
 mongo_client = AsyncIOMotorClient(settings.MONGO_URL)
 db = mongo_client["s8builder"]
 template_collection = db["templates"]
+build_cache_collection = db["build_cache"]
+preview_manifest_collection = db["preview_manifests"]
+generated_pages_collection = db["generated_pages"]
 
 session = aioboto3.Session()
 BUCKET = settings.BUCKET_NAME
 REGION = settings.AWS_REGION
+# Optional S3-compatible endpoint (e.g. MinIO) for local runs and benchmarks
+S3_ENDPOINT_URL = getattr(settings, "S3_ENDPOINT_URL", None)
+
+UPLOAD_CONCURRENCY = int(getattr(settings, "UPLOAD_CONCURRENCY", 16))
+UPLOAD_MAX_ATTEMPTS = int(getattr(settings, "UPLOAD_MAX_ATTEMPTS", 4))
+MULTIPART_THRESHOLD = int(getattr(settings, "MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+transfer_config = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=8 * 1024 * 1024,
+)
 
 # Make these regular functions
 def get_s3_client():
@@ -34,6 +66,8 @@ def get_s3_client():
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
         region_name=settings.AWS_REGION,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=BotoConfig(max_pool_connections=max(UPLOAD_CONCURRENCY, 10)),
     )
 
 def get_sqs_client():
@@ -63,22 +97,215 @@ logger.addHandler(handler)
 # -----------------------------
 # Graceful shutdown
 # -----------------------------
+# On the first signal the worker stops receiving and drains: running builds
+# get until drain_deadline, work that never started goes straight back to
+# the queue. A second signal cuts the drain short.
+SHUTDOWN_DRAIN_SECONDS = int(getattr(settings, "SHUTDOWN_DRAIN_SECONDS", 300))
 stop_flag = False
+drain_deadline: Optional[float] = None
 
-def handle_shutdown(sig, frame):
-    global stop_flag
-    logger.info(f"Received shutdown signal: {sig}. Stopping worker...")
+def handle_shutdown(sig, frame=None):
+    global stop_flag, drain_deadline
+    if stop_flag:
+        logger.info(f"Received second shutdown signal: {sig}. Abandoning drain...")
+        drain_deadline = time.monotonic()
+        return
+    logger.info(f"Received shutdown signal: {sig}. Draining for up to {SHUTDOWN_DRAIN_SECONDS}s...")
     stop_flag = True
+    drain_deadline = time.monotonic() + SHUTDOWN_DRAIN_SECONDS
+    scheduler.drain()
+
+def drain_time_left() -> float:
+    return max(0.0, drain_deadline - time.monotonic()) if drain_deadline else SHUTDOWN_DRAIN_SECONDS
 
-signal.signal(signal.SIGTERM, handle_shutdown)
-signal.signal(signal.SIGINT, handle_shutdown)
+async def wait_until_drained(tasks) -> set:
+    """
+    Wait for `tasks`; once the worker is draining, only until the drain
+    deadline. Whatever is still running then is cancelled and returned.
+    """
+    unfinished = set(tasks)
+    while unfinished:
+        # Short waits so a signal (or a second one) is noticed promptly
+        timeout = min(drain_time_left(), 1.0) if stop_flag else 1.0
+        if timeout <= 0:
+            break
+        _, unfinished = await asyncio.wait(unfinished, timeout=timeout)
+    for task in unfinished:
+        task.cancel()
+    await asyncio.gather(*unfinished, return_exceptions=True)
+    return unfinished
+
+def install_signal_handlers():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            # Runs on the loop, so the handler can touch scheduler state safely
+            loop.add_signal_handler(sig, handle_shutdown, sig)
+        except NotImplementedError:
+            signal.signal(sig, handle_shutdown)
 
 # -----------------------------
 # Utils
 # -----------------------------
-async def run_async(cmd, cwd=None, timeout=None, env=None):
+BUILD_LOG_TAIL_BYTES = int(getattr(settings, "BUILD_LOG_TAIL_BYTES", 64 * 1024))
+BUILD_LOG_MAX_LINE = 8 * 1024
+
+class BuildLog:
+    """
+    Bounded tail of a build's output. Lines are logged as they arrive,
+    only the last BUILD_LOG_TAIL_BYTES are kept, and live subscribers get
+    each line through their own bounded queue.
+    """
+
+    def __init__(self, label: Optional[str] = None, max_bytes: int = BUILD_LOG_TAIL_BYTES):
+        self.label = label
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.subscribers = set()
+
+    def append(self, line: str):
+        logger.info(f"[{self.label}] {line}" if self.label else line)
+        self.lines.append(line)
+        self.size += len(line) + 1
+        while self.size > self.max_bytes and len(self.lines) > 1:
+            self.size -= len(self.lines.popleft()) + 1
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(line)
+            except asyncio.QueueFull:
+                pass  # slow subscribers miss lines rather than stall the build
+
+    def subscribe(self, maxsize: int = 1000) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=maxsize)
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self.subscribers.discard(q)
+
+    def tail(self) -> str:
+        return "\n".join(self.lines)
+
+# Logs of builds currently running on this worker, by template id
+build_logs = {}
+
+def subscribe_build_log(template_id: str) -> Optional[asyncio.Queue]:
+    build_log = build_logs.get(template_id)
+    return build_log.subscribe() if build_log else None
+
+# -----------------------------
+# Build phase timings
+# -----------------------------
+RESOURCE_SAMPLE_INTERVAL = 0.5
+TIMING_HISTORY = 500
+
+class PhaseTimings:
+    """
+    Wall time per build phase, plus CPU time and peak RSS of the
+    subprocess tree for phases that run commands (sampled via psutil).
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextlib.asynccontextmanager
+    async def phase(self, name: str):
+        record = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+        started = time.monotonic()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(record["wall_s"] + time.monotonic() - started, 3)
+
+    def total_wall(self) -> float:
+        return round(sum(p["wall_s"] for p in self.phases.values()), 3)
+
+    def as_dict(self) -> dict:
+        return {name: dict(record) for name, record in self.phases.items()}
+
+async def _sample_process_tree(pid: int, usage: dict):
+    cpu_by_pid = {}
+    try:
+        root = psutil.Process(pid)
+        while True:
+            rss = 0
+            for p in [root, *root.children(recursive=True)]:
+                try:
+                    with p.oneshot():
+                        rss += p.memory_info().rss
+                        times = p.cpu_times()
+                        cpu_by_pid[p.pid] = times.user + times.system
+                except psutil.Error:
+                    pass
+            usage["peak_rss_mb"] = max(usage["peak_rss_mb"], round(rss / (1024 * 1024), 1))
+            await asyncio.sleep(RESOURCE_SAMPLE_INTERVAL)
+    except psutil.Error:
+        pass
+    finally:
+        usage["cpu_s"] = round(usage["cpu_s"] + sum(cpu_by_pid.values()), 3)
+
+# framework -> phase -> recent wall times of successful builds
+framework_timings = defaultdict(lambda: defaultdict(lambda: deque(maxlen=TIMING_HISTORY)))
+
+def record_framework_timings(framework: str, timings: PhaseTimings):
+    history = framework_timings[framework]
+    for name, record in timings.phases.items():
+        history[name].append(record["wall_s"])
+    history["total"].append(timings.total_wall())
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def framework_percentiles() -> dict:
+    """p50/p90/p99 wall time per framework (as returned by detect_framework) and phase."""
+    result = {}
+    for framework, phases in framework_timings.items():
+        result[framework] = {}
+        for name, values in phases.items():
+            ordered = sorted(values)
+            result[framework][name] = {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 50),
+                "p90": _percentile(ordered, 90),
+                "p99": _percentile(ordered, 99),
+            }
+    return result
+
+async def _stream_output(stream: asyncio.StreamReader, build_log: BuildLog):
+    pending = b""
+    while True:
+        chunk = await stream.read(64 * 1024)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > BUILD_LOG_MAX_LINE:
+            lines.append(pending)
+            pending = b""
+        for raw in lines:
+            build_log.append(raw.decode(errors="replace").rstrip("\r"))
+    if pending:
+        build_log.append(pending.decode(errors="replace").rstrip("\r"))
+
+def _kill_process_tree(pid: int):
+    try:
+        parent = psutil.Process(pid)
+        for child in parent.children(recursive=True):
+            child.kill()
+        parent.kill()
+    except psutil.NoSuchProcess:
+        pass
+
+class CommandTimeout(RuntimeError):
+    pass
+
+async def run_async(cmd, cwd=None, timeout=None, env=None, build_log: Optional[BuildLog] = None,
+                    usage: Optional[dict] = None):
     logger.info(f"$ {' '.join(cmd)} (cwd={cwd})")
     env = env or os.environ.copy()
+    build_log = build_log or BuildLog()
     proc = await asyncio.create_subprocess_exec(
         *cmd,
         cwd=cwd,
@@ -86,20 +313,25 @@ async def run_async(cmd, cwd=None, timeout=None, env=None):
         stderr=asyncio.subprocess.STDOUT,
         env=env
     )
+    sampler = asyncio.create_task(_sample_process_tree(proc.pid, usage)) if usage is not None else None
     try:
-        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
-        if stdout:
-            logger.info(stdout.decode().strip())
+        await asyncio.wait_for(_stream_output(proc.stdout, build_log), timeout=timeout)
+        await proc.wait()
         if proc.returncode != 0:
-            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout)
-        return stdout.decode()
+            raise subprocess.CalledProcessError(proc.returncode, cmd, build_log.tail())
+        return build_log.tail()
     except asyncio.TimeoutError:
         logger.error(f"Command timed out after {timeout} seconds: {' '.join(cmd)}")
-        parent = psutil.Process(proc.pid)
-        for child in parent.children(recursive=True):
-            child.kill()
-        parent.kill()
-        raise RuntimeError(f"Timeout expired for command: {' '.join(cmd)}")
+        _kill_process_tree(proc.pid)
+        raise CommandTimeout(f"Timeout expired for command: {' '.join(cmd)}")
+    except asyncio.CancelledError:
+        # e.g. a build still running when the shutdown drain runs out
+        _kill_process_tree(proc.pid)
+        raise
+    finally:
+        if sampler:
+            sampler.cancel()
+            await asyncio.gather(sampler, return_exceptions=True)
 
 def safe_rmtree(path: str):
     try:
@@ -108,12 +340,48 @@ def safe_rmtree(path: str):
     except Exception as e:
         logger.warning(f"Cleanup warning for {path}: {e}")
 
+MAX_EXTRACT_BYTES = int(getattr(settings, "MAX_EXTRACT_BYTES", 2 * 1024 * 1024 * 1024))
+MAX_EXTRACT_FILES = int(getattr(settings, "MAX_EXTRACT_FILES", 100_000))
+
 def unzip_to(zip_path: str, dst: str):
+    """
+    Blocking; run it in an executor. Members are streamed out one chunk
+    at a time and the actual decompressed bytes are counted, so archives
+    that lie about their sizes still hit MAX_EXTRACT_BYTES.
+    """
     safe_rmtree(dst)
     os.makedirs(dst, exist_ok=True)
-    import zipfile
+    root = os.path.realpath(dst)
+    total = 0
     with zipfile.ZipFile(zip_path, "r") as zf:
-        zf.extractall(dst)
+        members = zf.infolist()
+        if len(members) > MAX_EXTRACT_FILES:
+            raise ValueError(f"Archive has {len(members)} entries (limit {MAX_EXTRACT_FILES})")
+        for info in members:
+            target = os.path.realpath(os.path.join(root, info.filename))
+            if not target.startswith(root + os.sep):
+                raise ValueError(f"Unsafe path in archive: {info.filename}")
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zf.open(info) as src, open(target, "wb") as out:
+                for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                    total += len(chunk)
+                    if total > MAX_EXTRACT_BYTES:
+                        raise ValueError(f"Archive expands beyond {MAX_EXTRACT_BYTES} bytes")
+                    out.write(chunk)
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 def read_package_json(path: str) -> Optional[dict]:
     pj = os.path.join(path, "package.json")
@@ -126,11 +394,14 @@ def read_package_json(path: str) -> Optional[dict]:
         logger.warning(f"Failed to read package.json: {e}")
         return None
 
-def detect_framework(project_dir: str) -> Tuple[str, Optional[str]]:
-    pkg = read_package_json(project_dir)
-    if not pkg:
+def classify_project(pkg: Optional[dict], has_dir) -> Tuple[str, Optional[str]]:
+    if not pkg or not isinstance(pkg, dict):
         return "plain", None
-    deps = {**pkg.get("dependencies", {}), **pkg.get("devDependencies", {})}
+    # Like npm, ignore dependency fields that aren't objects (e.g. null)
+    deps = {}
+    for field in ("dependencies", "devDependencies"):
+        if isinstance(pkg.get(field), dict):
+            deps.update(pkg[field])
     if "next" in deps:
         return "next", None
     if "vite" in deps:
@@ -138,10 +409,37 @@ def detect_framework(project_dir: str) -> Tuple[str, Optional[str]]:
     if "react" in deps:
         return "cra", None
     for guess in ("dist", "build", "out"):
-        if os.path.exists(os.path.join(project_dir, guess)):
+        if has_dir(guess):
             return "unknown", guess
     return "plain", None
 
+def detect_framework(project_dir: str) -> Tuple[str, Optional[str]]:
+    pkg = read_package_json(project_dir)
+    return classify_project(pkg, lambda d: os.path.exists(os.path.join(project_dir, d)))
+
+def zip_root_prefix(zf: zipfile.ZipFile) -> str:
+    """The single top-level folder to strip, mirroring what fetch_stage does after extraction."""
+    names = [i.filename for i in zf.infolist()]
+    tops = {n.split("/", 1)[0] for n in names if n and not n.startswith(".")}
+    if len(tops) == 1:
+        top = tops.pop()
+        if any(n.startswith(f"{top}/") for n in names):
+            return f"{top}/"
+    return ""
+
+def detect_framework_in_zip(zf: zipfile.ZipFile) -> Tuple[str, Optional[str], str]:
+    """detect_framework from the central directory alone; also returns the root prefix."""
+    prefix = zip_root_prefix(zf)
+    names = set(zf.namelist())
+    pkg = None
+    if f"{prefix}package.json" in names:
+        try:
+            pkg = json.loads(zf.read(f"{prefix}package.json"))
+        except Exception as e:
+            logger.warning(f"Failed to read package.json: {e}")
+    framework, guess = classify_project(pkg, lambda d: any(n.startswith(f"{prefix}{d}/") for n in names))
+    return framework, guess, prefix
+
 def ensure_build_output(project_dir: str, framework: str, guessed_dir: Optional[str]) -> Optional[str]:
     if guessed_dir:
         p = os.path.join(project_dir, guessed_dir)
@@ -153,174 +451,1902 @@ def ensure_build_output(project_dir: str, framework: str, guessed_dir: Optional[
             return p
     return project_dir
 
-async def build_project_if_needed(project_dir: str) -> str:
+# -----------------------------
+# Work cache checkpoints (resume retries after the last completed phase)
+# -----------------------------
+WORK_CACHE_DIR = getattr(settings, "WORK_CACHE_DIR", None) or os.path.join(tempfile.gettempdir(), "s8builder_work")
+WORK_CACHE_TTL_SECONDS = int(getattr(settings, "WORK_CACHE_TTL_SECONDS", 24 * 3600))
+WORK_CACHE_MAX_BYTES = int(getattr(settings, "WORK_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+WORK_CACHE_SWEEP_INTERVAL = int(getattr(settings, "WORK_CACHE_SWEEP_INTERVAL", 600))
+
+class Checkpoints:
+    """
+    Markers for the phases completed in a template's work dir ("extracted",
+    "installed", "built"), each with a small dict of phase outputs. They
+    only count for the zip they were made from.
+    """
+
+    def __init__(self, work_dir: str, zip_key: str):
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, "checkpoints.json")
+        self.zip_key = zip_key
+        self.phases = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("zip_key") != self.zip_key:
+            return False
+        self.phases = data.get("phases", {})
+        return True
+
+    def done(self, phase: str) -> bool:
+        return phase in self.phases
+
+    def get(self, phase: str) -> dict:
+        return self.phases.get(phase, {})
+
+    def mark(self, phase: str, **outputs):
+        self.phases[phase] = outputs
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"zip_key": self.zip_key, "phases": self.phases}, f)
+        os.replace(tmp, self.path)
+
+def open_work_dir(template_id: str, zip_key: str) -> Checkpoints:
+    """Reuse the template's work dir if it holds an extraction of this zip, else start it afresh."""
+    checkpoints = Checkpoints(os.path.join(WORK_CACHE_DIR, template_id), zip_key)
+    if checkpoints.load() and checkpoints.done("extracted"):
+        os.utime(checkpoints.work_dir, None)
+        return checkpoints
+    checkpoints.phases = {}
+    safe_rmtree(checkpoints.work_dir)
+    os.makedirs(checkpoints.work_dir)
+    return checkpoints
+
+def sweep_work_cache(keep=()):
+    """
+    Blocking. Drop work dirs left by failed or abandoned templates once
+    they go stale, then the least recently used until the cache fits
+    WORK_CACHE_MAX_BYTES. Dirs named in `keep` (templates in progress) stay.
+    """
+    if not os.path.isdir(WORK_CACHE_DIR):
+        return
+    cutoff = time.time() - WORK_CACHE_TTL_SECONDS
+    entries = []
+    total = 0
+    for name in os.listdir(WORK_CACHE_DIR):
+        path = os.path.join(WORK_CACHE_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        size = _tree_size(path)
+        total += size
+        if name in keep:
+            continue
+        if mtime < cutoff:
+            logger.info(f"Removing stale work dir for template {name}")
+            safe_rmtree(path)
+            total -= size
+            continue
+        entries.append((mtime, size, name, path))
+
+    for _, size, name, path in sorted(entries):
+        if total <= WORK_CACHE_MAX_BYTES:
+            break
+        logger.info(f"Evicting work dir for template {name} ({size} bytes) to stay within the work cache budget")
+        safe_rmtree(path)
+        total -= size
+
+async def sweep_work_cache_forever():
+    while True:
+        try:
+            await asyncio.to_thread(sweep_work_cache, set(active_templates))
+        except Exception as e:
+            logger.warning(f"Work cache sweep failed: {e}")
+        await asyncio.sleep(WORK_CACHE_SWEEP_INTERVAL)
+
+# -----------------------------
+# Dependency cache (node_modules keyed on lockfile + Node version)
+# -----------------------------
+NPM_CACHE_DIR = getattr(settings, "NPM_CACHE_DIR", None) or os.path.join(tempfile.gettempdir(), "s8builder_npm_cache")
+NPM_CACHE_MAX_BYTES = int(getattr(settings, "NPM_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json")
+
+dep_cache_stats = {"hits": 0, "misses": 0}
+_node_version: Optional[str] = None
+
+async def get_node_version() -> str:
+    global _node_version
+    if _node_version is None:
+        try:
+            _node_version = (await run_async(["node", "--version"], timeout=30)).strip()
+        except Exception as e:
+            logger.warning(f"Could not determine Node version: {e}")
+            _node_version = "unknown"
+    return _node_version
+
+def dependency_cache_key(project_dir: str, node_version: str) -> Optional[str]:
+    for lf in LOCKFILES:
+        path = os.path.join(project_dir, lf)
+        if not os.path.exists(path):
+            continue
+        h = hashlib.sha256(f"{node_version}\0{lf}\0".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    return None
+
+def _link_or_copy(src: str, dst: str):
+    # Hardlinks make restores near-instant; fall back to a copy across filesystems
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+def restore_node_modules(key: str, project_dir: str) -> bool:
+    entry = os.path.join(NPM_CACHE_DIR, key)
+    cached = os.path.join(entry, "node_modules")
+    if not os.path.isdir(cached):
+        return False
+    dst = os.path.join(project_dir, "node_modules")
+    safe_rmtree(dst)
+    shutil.copytree(cached, dst, symlinks=True, copy_function=_link_or_copy)
+    os.utime(entry, None)  # mtime doubles as LRU timestamp
+    return True
+
+def store_node_modules(key: str, project_dir: str):
+    src = os.path.join(project_dir, "node_modules")
+    if not os.path.isdir(src):
+        return
+    entry = os.path.join(NPM_CACHE_DIR, key)
+    if os.path.isdir(entry):
+        os.utime(entry, None)
+        return
+    os.makedirs(NPM_CACHE_DIR, exist_ok=True)
+    # Populate a hidden staging dir and rename it into place so concurrent
+    # builds never observe a half-written entry.
+    staging = tempfile.mkdtemp(prefix=f".{key}.", dir=NPM_CACHE_DIR)
+    try:
+        shutil.copytree(src, os.path.join(staging, "node_modules"), symlinks=True, copy_function=_link_or_copy)
+        with open(os.path.join(staging, "size"), "w") as f:
+            f.write(str(_tree_size(staging)))
+        os.rename(staging, entry)
+    except OSError as e:
+        logger.warning(f"Could not store dependency cache entry {key[:12]}: {e}")
+        safe_rmtree(staging)
+    evict_dependency_cache()
+
+def evict_dependency_cache():
+    entries = []
+    for name in os.listdir(NPM_CACHE_DIR):
+        path = os.path.join(NPM_CACHE_DIR, name)
+        if name.startswith("."):
+            # Leftover staging dir from a crashed build
+            if os.path.getmtime(path) < time.time() - 3600:
+                safe_rmtree(path)
+            continue
+        try:
+            with open(os.path.join(path, "size")) as f:
+                size = int(f.read())
+        except (OSError, ValueError):
+            size = _tree_size(path)
+        entries.append((os.path.getmtime(path), size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= NPM_CACHE_MAX_BYTES:
+            break
+        logger.info(f"Evicting dependency cache entry {os.path.basename(path)[:12]} ({size} bytes)")
+        safe_rmtree(path)
+        total -= size
+
+async def install_dependencies(project_dir: str, env: dict, template_id: Optional[str] = None,
+                               build_log: Optional[BuildLog] = None, usage: Optional[dict] = None):
+    has_lock = any(os.path.exists(os.path.join(project_dir, lf)) for lf in LOCKFILES)
+    install_cmd = ["npm", "ci"] if has_lock else ["npm", "install", "--legacy-peer-deps"]
+
+    cache_key = dependency_cache_key(project_dir, await get_node_version()) if has_lock else None
+    if cache_key:
+        try:
+            if await asyncio.to_thread(restore_node_modules, cache_key, project_dir):
+                dep_cache_stats["hits"] += 1
+                logger.info(
+                    f"Dependency cache hit for template {template_id} (key={cache_key[:12]}, "
+                    f"hits={dep_cache_stats['hits']}, misses={dep_cache_stats['misses']})"
+                )
+                return
+        except Exception as e:
+            logger.warning(f"Dependency cache restore failed for {cache_key[:12]}: {e}")
+        dep_cache_stats["misses"] += 1
+        logger.info(
+            f"Dependency cache miss for template {template_id} (key={cache_key[:12]}, "
+            f"hits={dep_cache_stats['hits']}, misses={dep_cache_stats['misses']})"
+        )
+
+    await run_async(install_cmd, cwd=project_dir, timeout=20*60, env=env, build_log=build_log, usage=usage)
+
+    if cache_key:
+        try:
+            await asyncio.to_thread(store_node_modules, cache_key, project_dir)
+        except Exception as e:
+            logger.warning(f"Dependency cache store failed for {cache_key[:12]}: {e}")
+
+async def build_project_if_needed(project_dir: str, template_id: Optional[str] = None,
+                                  build_log: Optional[BuildLog] = None,
+                                  timings: Optional[PhaseTimings] = None,
+                                  checkpoints: Optional[Checkpoints] = None) -> str:
+    timings = timings or PhaseTimings()
     framework, guess = detect_framework(project_dir)
     logger.info(f"Detected framework: {framework} (guess out: {guess})")
     out_dir = ensure_build_output(project_dir, framework, guess)
 
     if framework != "plain":
         env = os.environ.copy()
-        has_lock = any(os.path.exists(os.path.join(project_dir, lf)) for lf in ("package-lock.json", "npm-shrinkwrap.json"))
-        install_cmd = ["npm", "ci"] if has_lock else ["npm", "install", "--legacy-peer-deps"]
-        await run_async(install_cmd, cwd=project_dir, timeout=20*60, env=env)
+        if checkpoints and checkpoints.done("installed"):
+            logger.info(f"Reusing installed dependencies for template {template_id}")
+        else:
+            async with timings.phase("install") as usage:
+                await install_dependencies(project_dir, env, template_id, build_log, usage)
+            if checkpoints:
+                checkpoints.mark("installed")
 
         pkg = read_package_json(project_dir) or {}
         scripts = pkg.get("scripts", {})
 
-        if framework == "next":
-            if "build" in scripts:
-                await run_async(["npm", "run", "build"], cwd=project_dir, timeout=30*60, env=env)
-            if "export" in scripts:
-                await run_async(["npm", "run", "export"], cwd=project_dir, timeout=15*60, env=env)
-            else:
-                try:
-                    await run_async(["npx", "next", "export"], cwd=project_dir, timeout=15*60, env=env)
-                except Exception as e:
-                    logger.warning(f"next export fallback failed: {e}")
-        elif framework in ("vite", "cra", "unknown"):
-            await run_async(["npm", "run", "build"], cwd=project_dir, timeout=30*60, env=env)
+        async with timings.phase("build") as usage:
+            if framework == "next":
+                if "build" in scripts:
+                    await run_async(["npm", "run", "build"], cwd=project_dir, timeout=30*60, env=env, build_log=build_log, usage=usage)
+                if "export" in scripts:
+                    await run_async(["npm", "run", "export"], cwd=project_dir, timeout=15*60, env=env, build_log=build_log, usage=usage)
+                else:
+                    try:
+                        await run_async(["npx", "next", "export"], cwd=project_dir, timeout=15*60, env=env, build_log=build_log, usage=usage)
+                    except Exception as e:
+                        logger.warning(f"next export fallback failed: {e}")
+            elif framework in ("vite", "cra", "unknown"):
+                await run_async(["npm", "run", "build"], cwd=project_dir, timeout=30*60, env=env, build_log=build_log, usage=usage)
 
         out_dir = ensure_build_output(project_dir, framework, guess)
 
+    if checkpoints:
+        checkpoints.mark("built", out_dir=os.path.relpath(out_dir, checkpoints.work_dir))
     return out_dir
 
 # -----------------------------
 # Async S3 helpers
 # -----------------------------
-async def upload_folder_to_s3(folder_path: str, s3_prefix: str):
+async def upload_with_retry(key: str, semaphore: asyncio.Semaphore, send):
+    """`send` is a zero-argument coroutine function making one upload attempt."""
+    async with semaphore:
+        for attempt in range(1, UPLOAD_MAX_ATTEMPTS + 1):
+            try:
+                await send()
+                return
+            except Exception as e:
+                if attempt == UPLOAD_MAX_ATTEMPTS:
+                    raise
+                delay = 0.5 * 2 ** (attempt - 1)
+                logger.warning(f"Upload of {key} failed (attempt {attempt}/{UPLOAD_MAX_ATTEMPTS}): {e}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+async def run_uploads(uploads: list, s3_prefix: str) -> dict:
+    """Upload [(key, size, send(s3_client))] with bounded concurrency over one shared client."""
+    total_bytes = sum(size for _, size, _ in uploads)
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    started = time.monotonic()
+    async with get_s3_client() as s3_client:
+        results = await asyncio.gather(
+            *(upload_with_retry(key, semaphore, functools.partial(send, s3_client)) for key, _, send in uploads),
+            return_exceptions=True,
+        )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(uploads)} upload(s) to {s3_prefix} failed: {errors[0]}")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    mb = total_bytes / (1024 * 1024)
+    logger.info(f"Uploaded {len(uploads)} file(s), {mb:.1f} MB to {s3_prefix} in {elapsed:.1f}s ({mb / elapsed:.1f} MB/s)")
+    return {"files": len(uploads), "bytes": total_bytes, "seconds": round(elapsed, 3)}
+
+# -----------------------------
+# Preview assets (content type, cache headers, pre-compression)
+# -----------------------------
+COMPRESS_MIN_BYTES = int(getattr(settings, "COMPRESS_MIN_BYTES", 1024))
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/xml",
+    "application/manifest+json", "image/svg+xml", "application/wasm",
+)
+# Bundler content hashes right before the extension: Vite/Rollup's
+# base64url index-BfXk2-9a.js, CRA's main.8e1d2c3a.chunk.js
+HASHED_NAME_RE = re.compile(r"[.-][A-Za-z0-9_-]{8,}(?:\.chunk)?\.[A-Za-z0-9]+$")
+# Output dirs that only ever hold hashed files; names elsewhere (public/
+# copies like font-awesome4.woff) can look hashed without being versioned
+HASHED_OUTPUT_DIRS = ("assets/", "static/js/", "static/css/", "static/media/")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+mimetypes.add_type("application/javascript", ".mjs")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+@dataclass
+class Asset:
+    rel: str                     # key relative to the preview prefix
+    size: int
+    extra_args: dict             # ContentType / ContentEncoding / CacheControl
+    sha256: str                  # of the stored body
+    path: Optional[str] = None   # local file to upload, or
+    body: Optional[bytes] = None # in-memory body
+
+def asset_headers(rel: str) -> dict:
+    content_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+    if rel.startswith("_next/static/") or (
+        rel.startswith(HASHED_OUTPUT_DIRS) and HASHED_NAME_RE.search(os.path.basename(rel))
+    ):
+        cache_control = IMMUTABLE_CACHE
+    elif content_type == "text/html":
+        cache_control = "no-cache"
+    else:
+        cache_control = "public, max-age=3600"
+    return {"ContentType": content_type, "CacheControl": cache_control}
+
+def is_compressible(headers: dict, size: int) -> bool:
+    return size >= COMPRESS_MIN_BYTES and headers["ContentType"].startswith(COMPRESSIBLE_TYPES)
+
+def encode_asset(rel: str, data: bytes) -> list:
+    """
+    Return [(rel, body, extra_args)] for one file. Compressible text above
+    COMPRESS_MIN_BYTES is stored gzip-encoded under its own key: S3 can't
+    negotiate Accept-Encoding, and every browser accepts gzip.
+    """
+    headers = asset_headers(rel)
+    if not is_compressible(headers, len(data)):
+        return [(rel, data, headers)]
+    gz = gzip.compress(data, compresslevel=6, mtime=0)
+    if len(gz) >= len(data):
+        return [(rel, data, headers)]
+    return [(rel, gz, {**headers, "ContentEncoding": "gzip"})]
+
+class CompressionStats:
+    def __init__(self):
+        self.files = 0
+        self.compressed_files = 0
+        self.original_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, original_size: int, stored_size: int):
+        self.files += 1
+        self.original_bytes += original_size
+        self.stored_bytes += stored_size
+        if stored_size != original_size:
+            self.compressed_files += 1
+
+    def as_dict(self) -> dict:
+        ratio = self.original_bytes / self.stored_bytes if self.stored_bytes else 1.0
+        return {
+            "files": self.files,
+            "compressed_files": self.compressed_files,
+            "original_bytes": self.original_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(ratio, 2),
+        }
+
+def prepare_folder_assets(folder_path: str, encoded_dir: str) -> Tuple[list, dict]:
+    """Blocking. Encoded copies are written under `encoded_dir`; other files upload as-is."""
+    assets = []
+    stats = CompressionStats()
+    for root, _, names in os.walk(folder_path):
+        for f in names:
+            full = os.path.join(root, f)
+            rel = os.path.relpath(full, folder_path).replace(os.sep, "/")
+            size = os.path.getsize(full)
+            headers = asset_headers(rel)
+            if not is_compressible(headers, size):
+                stats.add(size, size)
+                assets.append(Asset(rel, size, headers, file_sha256(full), path=full))
+                continue
+            with open(full, "rb") as fh:
+                data = fh.read()
+            encoded = encode_asset(rel, data)
+            stats.add(size, len(encoded[0][1]))
+            for enc_rel, body, extra_args in encoded:
+                digest = hashlib.sha256(body).hexdigest()
+                if body is data:
+                    assets.append(Asset(enc_rel, size, extra_args, digest, path=full))
+                    continue
+                enc_path = os.path.join(encoded_dir, *enc_rel.split("/"))
+                os.makedirs(os.path.dirname(enc_path), exist_ok=True)
+                with open(enc_path, "wb") as fh:
+                    fh.write(body)
+                assets.append(Asset(enc_rel, len(body), extra_args, digest, path=enc_path))
+    return assets, stats.as_dict()
+
+def prepare_zip_assets(zf: zipfile.ZipFile, root_prefix: str) -> Tuple[list, dict]:
+    """Blocking. Archive members become in-memory assets without touching disk."""
+    assets = []
+    stats = CompressionStats()
+    for info in zf.infolist():
+        if info.is_dir() or not info.filename.startswith(root_prefix):
+            continue
+        rel = info.filename[len(root_prefix):]
+        if rel.startswith("/") or ".." in rel.split("/"):
+            raise ValueError(f"Unsafe path in archive: {info.filename}")
+        data = zf.read(info)
+        encoded = encode_asset(rel, data)
+        stats.add(len(data), len(encoded[0][1]))
+        assets.extend(
+            Asset(enc_rel, len(body), extra_args, hashlib.sha256(body).hexdigest(), body=body)
+            for enc_rel, body, extra_args in encoded
+        )
+    return assets, stats.as_dict()
+
+async def upload_assets_to_s3(assets: list, s3_prefix: str) -> dict:
+    def send(s3_client, asset: Asset):
+        key = f"{s3_prefix}/{asset.rel}"
+        if asset.path:
+            # Config switches to multipart above MULTIPART_THRESHOLD
+            return s3_client.upload_file(asset.path, BUCKET, key, ExtraArgs=asset.extra_args, Config=transfer_config)
+        return s3_client.put_object(Bucket=BUCKET, Key=key, Body=asset.body, **asset.extra_args)
+
+    return await run_uploads([
+        (f"{s3_prefix}/{a.rel}", a.size, functools.partial(send, asset=a)) for a in assets
+    ], s3_prefix)
+
+async def delete_s3_keys(keys: list):
     async with get_s3_client() as s3_client:
-        for root, _, files in os.walk(folder_path):
-            for f in files:
-                full = os.path.join(root, f)
-                rel = os.path.relpath(full, folder_path).replace(os.sep, "/")
-                key = f"{s3_prefix}/{rel}"
-                await s3_client.upload_file(full, BUCKET, key)
-
-async def presign(key: str, expires: int = 3600) -> str:
+        for i in range(0, len(keys), 1000):  # DeleteObjects takes at most 1000 keys
+            resp = await s3_client.delete_objects(
+                Bucket=BUCKET,
+                Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+            )
+            for err in resp.get("Errors", []):
+                logger.warning(f"Failed to delete {err.get('Key')}: {err.get('Message')}")
+
+async def sync_preview_assets(template_id: str, assets: list, s3_prefix: str) -> dict:
+    """
+    Upload only assets whose body or headers changed since the last
+    successful publish under `s3_prefix`, then delete keys that are no
+    longer part of the output. The manifest is replaced only after all
+    uploads succeed.
+    """
+    previous = await preview_manifest_collection.find_one({"_id": template_id})
+    known = {}
+    if previous and previous.get("s3_prefix") == s3_prefix:
+        known = {f["path"]: (f["sha256"], f.get("headers")) for f in previous.get("files", [])}
+
+    changed = [a for a in assets if known.get(a.rel) != (a.sha256, a.extra_args)]
+    current = {a.rel for a in assets}
+    stale = [f"{s3_prefix}/{rel}" for rel in known if rel not in current]
+
+    result = await upload_assets_to_s3(changed, s3_prefix)
+    await preview_manifest_collection.replace_one(
+        {"_id": template_id},
+        {
+            "s3_prefix": s3_prefix,
+            "files": [{"path": a.rel, "sha256": a.sha256, "size": a.size, "headers": a.extra_args} for a in assets],
+            "updated_at": datetime.utcnow(),
+        },
+        upsert=True,
+    )
+    if stale:
+        await delete_s3_keys(stale)
+
+    logger.info(
+        f"Synced {s3_prefix}: {len(changed)} of {len(assets)} asset(s) uploaded, "
+        f"{len(assets) - len(changed)} unchanged, {len(stale)} stale key(s) deleted"
+    )
+    return {**result, "unchanged": len(assets) - len(changed), "deleted": len(stale)}
+
+async def upload_folder_to_s3(folder_path: str, s3_prefix: str, encoded_dir: str) -> dict:
+    assets, stats = await asyncio.to_thread(prepare_folder_assets, folder_path, encoded_dir)
+    result = await upload_assets_to_s3(assets, s3_prefix)
+    return {**result, "compression": stats}
+
+async def s3_object_exists(key: str) -> bool:
     async with get_s3_client() as s3_client:
-        return await s3_client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": BUCKET, "Key": key},
-            ExpiresIn=expires,
+        try:
+            await s3_client.head_object(Bucket=BUCKET, Key=key)
+            return True
+        except Exception:
+            return False
+
+# -----------------------------
+# Template record helpers
+# -----------------------------
+async def set_template_fields(template_id: str, fields: dict):
+    await template_collection.update_one({"_id": ObjectId(template_id)}, {"$set": fields})
+
+# -----------------------------
+# Build deduplication (keyed on SHA-256 of the uploaded zip)
+# -----------------------------
+build_cache_stats = {"hits": 0, "misses": 0}
+
+async def find_cached_build(zip_sha256: str, template_id: str) -> Optional[dict]:
+    cached = await build_cache_collection.find_one({"_id": zip_sha256})
+    if not cached or cached.get("template_id") == template_id:
+        return None
+    if not await s3_object_exists(cached["preview_key"]):
+        # Source preview is gone; forget it and build normally
+        await build_cache_collection.delete_one({"_id": zip_sha256})
+        return None
+    return cached
+
+async def record_build(zip_sha256: str, template_id: str, preview_key: str):
+    await build_cache_collection.update_one(
+        {"_id": zip_sha256},
+        {"$setOnInsert": {
+            "template_id": template_id,
+            "preview_key": preview_key,
+            "created_at": datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+
+# -----------------------------
+# Build pipeline stages
+# -----------------------------
+# Each stage has its own concurrency pool, so network-bound S3 transfers
+# never hold one of the CPU-heavy build slots.
+MAX_CONCURRENT_FETCHES = int(getattr(settings, "MAX_CONCURRENT_FETCHES", 4))
+MAX_CONCURRENT_BUILDS = int(getattr(settings, "MAX_CONCURRENT_BUILDS", 3))
+MAX_CONCURRENT_COMPRESSIONS = int(getattr(settings, "MAX_CONCURRENT_COMPRESSIONS", 2))
+MAX_CONCURRENT_UPLOADS = int(getattr(settings, "MAX_CONCURRENT_UPLOADS", 4))
+
+# -----------------------------
+# Adaptive build admission
+# -----------------------------
+BUILD_CONCURRENCY_MIN = int(getattr(settings, "BUILD_CONCURRENCY_MIN", 1))
+BUILD_CONCURRENCY_MAX = int(getattr(settings, "BUILD_CONCURRENCY_MAX", max(MAX_CONCURRENT_BUILDS, psutil.cpu_count() or 1)))
+BUILD_MAX_CPU_PERCENT = float(getattr(settings, "BUILD_MAX_CPU_PERCENT", 85))
+BUILD_MIN_FREE_MEMORY_MB = int(getattr(settings, "BUILD_MIN_FREE_MEMORY_MB", 1536))
+BUILD_MIN_FREE_DISK_MB = int(getattr(settings, "BUILD_MIN_FREE_DISK_MB", 2048))
+BUILD_SAMPLE_INTERVAL = float(getattr(settings, "BUILD_SAMPLE_INTERVAL", 15))
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that moves between `minimum` and `maximum` based on
+    host CPU, available memory and free disk in the temp dir. A build is
+    admitted only while under the limit and (above the floor) only while
+    the host has headroom for one more.
+    """
+
+    def __init__(self, minimum: int, maximum: int, initial: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.running = 0
+        self.cond = asyncio.Condition()
+        # cpu_percent(interval=None) measures since the previous call, so
+        # back-to-back calls read ~0. Only run() samples it, once per
+        # BUILD_SAMPLE_INTERVAL; everything else uses this cached value.
+        self.cpu_percent = 0.0
+
+    def sample(self) -> dict:
+        return {
+            "cpu_percent": self.cpu_percent,
+            "free_memory_mb": psutil.virtual_memory().available // (1024 * 1024),
+            "free_disk_mb": shutil.disk_usage(tempfile.gettempdir()).free // (1024 * 1024),
+        }
+
+    def pressure(self, sample: dict) -> Optional[str]:
+        if sample["cpu_percent"] > BUILD_MAX_CPU_PERCENT:
+            return "cpu"
+        if sample["free_memory_mb"] < BUILD_MIN_FREE_MEMORY_MB:
+            return "memory"
+        if sample["free_disk_mb"] < BUILD_MIN_FREE_DISK_MB:
+            return "disk"
+        return None
+
+    async def acquire(self, label: str):
+        deferred = False
+        async with self.cond:
+            while True:
+                sample = self.sample()
+                pressure = self.pressure(sample) if self.running >= self.minimum else None
+                if self.running < self.limit and not pressure:
+                    break
+                if not deferred:
+                    reason = pressure or "limit"
+                    logger.info(f"Build admission deferred for {label} (reason={reason}, running={self.running}, limit={self.limit}, {sample})")
+                    deferred = True
+                try:
+                    await asyncio.wait_for(self.cond.wait(), timeout=BUILD_SAMPLE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.running += 1
+        logger.info(f"Build admitted for {label} (running={self.running}, limit={self.limit}, {sample})")
+
+    async def release(self):
+        async with self.cond:
+            self.running -= 1
+            self.cond.notify_all()
+
+    async def adjust(self):
+        sample = self.sample()
+        pressure = self.pressure(sample)
+        old = self.limit
+        if pressure:
+            self.limit = max(self.minimum, self.limit - 1)
+        elif (self.running >= self.limit
+              and sample["cpu_percent"] < BUILD_MAX_CPU_PERCENT * 0.6
+              and sample["free_memory_mb"] >= 2 * BUILD_MIN_FREE_MEMORY_MB):
+            # Only grow when the current limit is actually in use
+            self.limit = min(self.maximum, self.limit + 1)
+        if self.limit != old:
+            logger.info(f"Build concurrency {old} -> {self.limit} (pressure={pressure}, running={self.running}, {sample})")
+            async with self.cond:
+                self.cond.notify_all()
+
+    async def run(self):
+        psutil.cpu_percent(interval=None)  # prime the CPU counter
+        while True:
+            await asyncio.sleep(BUILD_SAMPLE_INTERVAL)
+            try:
+                self.cpu_percent = psutil.cpu_percent(interval=None)
+                await self.adjust()
+            except Exception as e:
+                logger.warning(f"Build concurrency sampling failed: {e}")
+
+build_limiter = AdaptiveLimiter(BUILD_CONCURRENCY_MIN, BUILD_CONCURRENCY_MAX, MAX_CONCURRENT_BUILDS)
+
+@dataclass
+class BuildJob:
+    template_id: str
+    zip_key: str
+    done: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    build_log: Optional[BuildLog] = None
+    timings: PhaseTimings = field(default_factory=PhaseTimings)
+    framework: Optional[str] = None
+    work_dir: Optional[str] = None
+    zip_sha256: Optional[str] = None
+    project_dir: Optional[str] = None
+    out_dir: Optional[str] = None
+    assets: list = field(default_factory=list)
+    compression: Optional[dict] = None
+    checkpoints: Optional[Checkpoints] = None
+    attempt: int = 1
+    error: Optional[Exception] = None
+
+FAST_LANE_MAX_BYTES = int(getattr(settings, "FAST_LANE_MAX_BYTES", 64 * 1024 * 1024))
+# The in-memory path holds every decompressed member (and its encodings)
+# until the upload ends, so it also bounds the expanded size; bigger
+# archives go through on-disk extraction instead.
+FAST_LANE_MAX_EXPANDED_BYTES = int(getattr(settings, "FAST_LANE_MAX_EXPANDED_BYTES", 128 * 1024 * 1024))
+
+def check_zip_limits(zf: zipfile.ZipFile):
+    members = zf.infolist()
+    if len(members) > MAX_EXTRACT_FILES:
+        raise ValueError(f"Archive has {len(members)} entries (limit {MAX_EXTRACT_FILES})")
+    # ZipExtFile never reads past the declared size, so the declared total is a hard bound
+    if sum(i.file_size for i in members) > MAX_EXTRACT_BYTES:
+        raise ValueError(f"Archive expands beyond {MAX_EXTRACT_BYTES} bytes")
+
+async def publish_static_zip(job: BuildJob, data: bytes) -> bool:
+    """
+    Static-site fast lane: decide the framework from the central directory
+    and, for plain sites, upload members straight from memory. Returns
+    False when the archive needs a real build.
+    """
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    framework, _, root_prefix = detect_framework_in_zip(zf)
+    if framework != "plain":
+        return False
+    check_zip_limits(zf)
+    expanded = sum(i.file_size for i in zf.infolist())
+    if expanded > FAST_LANE_MAX_EXPANDED_BYTES:
+        logger.info(f"Template {job.template_id} expands to {expanded} bytes; extracting to disk instead")
+        return False
+    job.framework = framework
+    s3_prefix = f"previews/{job.template_id}"
+    async with job.timings.phase("compress"):
+        assets, job.compression = await asyncio.to_thread(prepare_zip_assets, zf, root_prefix)
+    async with job.timings.phase("upload"):
+        await sync_preview_assets(job.template_id, assets, s3_prefix)
+    await finalize_template(job, f"{s3_prefix}/index.html")
+    return True
+
+async def fetch_stage(job: BuildJob) -> bool:
+    """Download and extract the zip. Returns False when no build is needed."""
+    logger.info(f"Processing template {job.template_id} (zip={job.zip_key}, attempt {job.attempt})")
+    job.checkpoints = await asyncio.to_thread(open_work_dir, job.template_id, job.zip_key)
+    job.work_dir = job.checkpoints.work_dir
+    if job.checkpoints.done("extracted"):
+        extracted = job.checkpoints.get("extracted")
+        job.zip_sha256 = extracted["zip_sha256"]
+        job.project_dir = os.path.join(job.work_dir, extracted["project_dir"])
+        job.framework = extracted["framework"]
+        logger.info(f"Resuming template {job.template_id} after phases {sorted(job.checkpoints.phases)}")
+        return True
+    zip_path = os.path.join(job.work_dir, os.path.basename(job.zip_key))
+
+    # Small archives are held in memory so static sites never touch disk
+    data = None
+    async with job.timings.phase("download"):
+        async with get_s3_client() as s3_client:
+            head = await s3_client.head_object(Bucket=BUCKET, Key=job.zip_key)
+            if head["ContentLength"] <= FAST_LANE_MAX_BYTES:
+                obj = await s3_client.get_object(Bucket=BUCKET, Key=job.zip_key)
+                async with obj["Body"] as body:
+                    data = await body.read()
+            else:
+                await s3_client.download_file(BUCKET, job.zip_key, zip_path)
+
+    if data is not None:
+        job.zip_sha256 = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    else:
+        job.zip_sha256 = await asyncio.to_thread(file_sha256, zip_path)
+    await set_template_fields(job.template_id, {"zip_sha256": job.zip_sha256})
+    cached = await find_cached_build(job.zip_sha256, job.template_id)
+    build_cache_stats["hits" if cached else "misses"] += 1
+    if cached:
+        await set_template_fields(job.template_id, {
+            "build_source": cached["template_id"],
+            "preview_key": cached["preview_key"],
+        })
+        await update_template_status(job.template_id, "ready", None)
+        logger.info(f"Template {job.template_id} matches build of {cached['template_id']} (sha256={job.zip_sha256[:12]}), skipping build")
+        return False
+
+    if data is not None:
+        if await publish_static_zip(job, data):
+            return False
+        await asyncio.to_thread(_write_bytes, zip_path, data)
+        data = None
+
+    extract_dir = os.path.join(job.work_dir, "src")
+    async with job.timings.phase("extract"):
+        await asyncio.to_thread(unzip_to, zip_path, extract_dir)
+    await asyncio.to_thread(os.remove, zip_path)
+    entries = [e for e in os.listdir(extract_dir) if not e.startswith(".")]
+    if len(entries) == 1 and os.path.isdir(os.path.join(extract_dir, entries[0])):
+        extract_dir = os.path.join(extract_dir, entries[0])
+    job.project_dir = extract_dir
+    job.framework, _ = detect_framework(extract_dir)
+    job.checkpoints.mark(
+        "extracted",
+        zip_sha256=job.zip_sha256,
+        project_dir=os.path.relpath(extract_dir, job.work_dir),
+        framework=job.framework,
+    )
+    return True
+
+async def build_stage(job: BuildJob) -> bool:
+    if job.checkpoints and job.checkpoints.done("built"):
+        job.out_dir = os.path.join(job.work_dir, job.checkpoints.get("built")["out_dir"])
+        logger.info(f"Reusing build output for template {job.template_id}: {job.out_dir}")
+        return True
+    job.out_dir = await build_project_if_needed(
+        job.project_dir, job.template_id, job.build_log, job.timings, job.checkpoints
+    )
+    logger.info(f"Build complete. Output={job.out_dir}")
+    return True
+
+async def compress_stage(job: BuildJob) -> bool:
+    encoded_dir = os.path.join(job.work_dir, "encoded")
+    async with job.timings.phase("compress"):
+        job.assets, job.compression = await asyncio.to_thread(prepare_folder_assets, job.out_dir, encoded_dir)
+    return True
+
+async def upload_stage(job: BuildJob) -> bool:
+    s3_prefix = f"previews/{job.template_id}"
+    async with job.timings.phase("upload"):
+        await sync_preview_assets(job.template_id, job.assets, s3_prefix)
+    await finalize_template(job, f"{s3_prefix}/index.html")
+    return True
+
+async def finalize_template(job: BuildJob, preview_key: str):
+    # Only the key is stored; the backend's preview route mints fresh URLs
+    await set_template_fields(job.template_id, {"preview_key": preview_key})
+    await update_template_status(job.template_id, "ready", None)
+    await record_build(job.zip_sha256, job.template_id, preview_key)
+    logger.info(f"Template {job.template_id} ready at {preview_key}")
+    if job.compression:
+        c = job.compression
+        logger.info(
+            f"Template {job.template_id} assets: {c['compressed_files']}/{c['files']} compressed, "
+            f"{c['original_bytes']} -> {c['stored_bytes']} bytes (ratio {c['ratio']})"
         )
+    if job.framework:
+        record_framework_timings(job.framework, job.timings)
+        p = framework_percentiles()[job.framework]["total"]
+        logger.info(f"{job.framework} build time over last {p['count']}: p50={p['p50']}s p90={p['p90']}s p99={p['p99']}s")
+
+async def save_job_stats(job: BuildJob):
+    fields = {
+        "build_timings": job.timings.as_dict(),
+        "build_seconds": job.timings.total_wall(),
+    }
+    # Dedup hits and early fetch failures never detect one; keep the
+    # framework the backend stored at upload
+    if job.framework is not None:
+        fields["framework"] = job.framework
+    if job.compression:
+        fields["compression"] = job.compression
+    await set_template_fields(job.template_id, fields)
+
+async def fail_job(job: BuildJob, error: Exception):
+    logger.error(f"Error processing template {job.template_id}: {error}")
+    await update_template_status(job.template_id, "error", None)
+    if job.build_log and job.build_log.lines:
+        await set_template_fields(job.template_id, {"build_log_tail": job.build_log.tail()})
+    dlq_url = getattr(settings, "SQS_DLQ_URL", None)
+    if dlq_url:
+        async with get_sqs_client() as sqs_client:
+            await sqs_client.send_message(
+                QueueUrl=dlq_url,
+                MessageBody=json.dumps({"template_id": job.template_id, "s3_key": job.zip_key})
+            )
+
+async def run_stage_guarded(stage_fn, job: BuildJob) -> bool:
+    """Run one stage; on failure keep the error on the job and report that the job is done."""
+    try:
+        return await stage_fn(job)
+    except Exception as e:
+        logger.warning(f"{stage_fn.__name__} failed for template {job.template_id} (attempt {job.attempt}): {e}")
+        job.error = e
+        return False
+
+async def complete_job(job: BuildJob):
+    try:
+        await save_job_stats(job)
+    except Exception as e:
+        logger.warning(f"Failed to save build stats for template {job.template_id}: {e}")
+    if not job.done.done():
+        job.done.set_result(None)
+
+class BuildPipeline:
+    """
+    Runs jobs through stages connected by bounded queues. A queue holds at
+    most as many jobs as its stage can run, so upstream stages block
+    (backpressure) instead of piling work up on disk.
+    """
+
+    def __init__(self, stages, admission_stage: str, admission_limiter: Optional[AdaptiveLimiter] = None):
+        self.stages = stages  # [(name, coroutine_fn, concurrency)]
+        self.queues = [asyncio.Queue(maxsize=concurrency) for _, _, concurrency in stages]
+        self.workers = []
+        self.in_flight = 0
+        # Jobs queued for or running in stages up to and including the
+        # admission stage count against free_slots(); later stages don't.
+        self.admission_index = [name for name, _, _ in stages].index(admission_stage)
+        self.admission_limiter = admission_limiter
+        self.stage_counts = [0] * len(stages)
+        self.slot_freed = asyncio.Event()
+
+    def start(self):
+        if self.workers:
+            return
+        for index, (name, _, concurrency) in enumerate(self.stages):
+            for n in range(concurrency):
+                self.workers.append(asyncio.create_task(self._run_stage(index), name=f"{name}-{n}"))
+        if self.admission_limiter:
+            self.workers.append(asyncio.create_task(self.admission_limiter.run(), name="admission-sampler"))
+
+    def queue_lengths(self) -> dict:
+        return {name: q.qsize() for (name, _, _), q in zip(self.stages, self.queues)}
+
+    def free_slots(self) -> int:
+        capacity = sum(concurrency for _, _, concurrency in self.stages[:self.admission_index + 1])
+        if self.admission_limiter:
+            capacity += self.admission_limiter.limit - self.stages[self.admission_index][2]
+        return capacity - sum(self.stage_counts[:self.admission_index + 1])
+
+    async def submit(self, job: BuildJob, stage: Optional[str] = None):
+        index = [name for name, _, _ in self.stages].index(stage) if stage else 0
+        self.start()
+        self.in_flight += 1
+        self.stage_counts[index] += 1
+        await self.queues[index].put(job)
+
+    async def _run_stage(self, index: int):
+        _, stage_fn, _ = self.stages[index]
+        queue = self.queues[index]
+        while True:
+            job = await queue.get()
+            limited = index == self.admission_index and self.admission_limiter
+            try:
+                if limited:
+                    await self.admission_limiter.acquire(job.template_id)
+                try:
+                    proceed = await run_stage_guarded(stage_fn, job)
+                finally:
+                    if limited:
+                        await self.admission_limiter.release()
+            finally:
+                queue.task_done()
+
+            self.stage_counts[index] -= 1
+            if index <= self.admission_index:
+                self.slot_freed.set()
+            if proceed and index + 1 < len(self.queues):
+                self.stage_counts[index + 1] += 1
+                await self.queues[index + 1].put(job)
+            else:
+                self.in_flight -= 1
+                await complete_job(job)
+
+pipeline = BuildPipeline([
+    ("fetch", fetch_stage, MAX_CONCURRENT_FETCHES),
+    ("build", build_stage, BUILD_CONCURRENCY_MAX),
+    ("compress", compress_stage, MAX_CONCURRENT_COMPRESSIONS),
+    ("upload", upload_stage, MAX_CONCURRENT_UPLOADS),
+], admission_stage="build", admission_limiter=build_limiter)
+
+# -----------------------------
+# Template leases (safe across worker nodes)
+# -----------------------------
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(getattr(settings, "TEMPLATE_LEASE_SECONDS", 300))
+LEASE_RENEW_INTERVAL = max(LEASE_SECONDS // 3, 5)
+# Recovered templates building at once during startup
+RECOVERY_CONCURRENCY = int(getattr(settings, "RECOVERY_CONCURRENCY", 5))
+
+# Templates this worker is currently processing
+active_templates = set()
+# "error" so DLQ redrives can retry a failed template
+CLAIMABLE_STATUSES = ("pending", "error")
+
+def _unleased(now: datetime) -> dict:
+    return {"$or": [
+        {"lease_expires_at": {"$exists": False}},
+        {"lease_expires_at": None},
+        {"lease_expires_at": {"$lt": now}},
+    ]}
+
+async def claim_template(template_id: str) -> Optional[dict]:
+    """
+    Atomically take the lease on a pending template unless another worker
+    holds a live one. A failed template is claimed too and goes back to
+    pending, so a message redriven from the DLQ rebuilds it (resuming from
+    its kept work dir). Ready templates are never claimed, so a stale
+    message can't rebuild them.
+    """
+    now = datetime.utcnow()
+    return await template_collection.find_one_and_update(
+        {
+            "_id": ObjectId(template_id),
+            "status": {"$in": list(CLAIMABLE_STATUSES)},
+            "$or": [_unleased(now), {"lease_owner": WORKER_ID}],
+        },
+        {
+            "$set": {"status": "pending", "lease_owner": WORKER_ID, "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS)},
+            "$unset": {"build_log_tail": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def claim_next_pending(exclude_users=(), created_before: Optional[datetime] = None) -> Optional[dict]:
+    now = datetime.utcnow()
+    query = {"status": "pending", **_unleased(now)}
+    if exclude_users:
+        query["uploaded_by"] = {"$nin": list(exclude_users)}
+    if created_before:
+        query["created_at"] = {"$lt": created_before}
+    return await template_collection.find_one_and_update(
+        query,
+        {"$set": {"lease_owner": WORKER_ID, "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def lease_time_left(template_id: str) -> Optional[float]:
+    """
+    Seconds until the current lease on a template runs out, or None if the
+    template no longer needs building (finished, or deleted).
+    """
+    template = await template_collection.find_one(
+        {"_id": ObjectId(template_id)}, {"status": 1, "lease_expires_at": 1}
+    )
+    if not template or template.get("status") not in CLAIMABLE_STATUSES:
+        return None
+    expires = template.get("lease_expires_at")
+    left = (expires - datetime.utcnow()).total_seconds() if expires else 0
+    # At least a second, so a lease that just lapsed is retried promptly
+    return max(left, 1.0)
+
+async def hold_lease(template_id: str):
+    while True:
+        await asyncio.sleep(LEASE_RENEW_INTERVAL)
+        try:
+            result = await template_collection.update_one(
+                {"_id": ObjectId(template_id), "lease_owner": WORKER_ID},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}},
+            )
+            if not result.matched_count:
+                logger.warning(f"Lost lease on template {template_id}")
+        except Exception as e:
+            logger.warning(f"Lease renewal failed for template {template_id}: {e}")
+
+async def release_lease(template_id: str):
+    await template_collection.update_one(
+        {"_id": ObjectId(template_id), "lease_owner": WORKER_ID},
+        {"$unset": {"lease_owner": "", "lease_expires_at": ""}},
+    )
 
 # -----------------------------
-# Semaphore for concurrency control
+# Fair scheduling across uploaders
 # -----------------------------
-MAX_CONCURRENT_BUILDS = 3
-build_semaphore = asyncio.Semaphore(MAX_CONCURRENT_BUILDS)
+PER_USER_MAX_IN_FLIGHT = int(getattr(settings, "PER_USER_MAX_IN_FLIGHT", 2))
+# Waiting templates this worker holds (their messages kept invisible by
+# heartbeats, which don't count as receives). It prefetches at most
+# FAIR_PREFETCH_PER_SLOT per free build slot, so the rest of a backlog
+# stays visible in SQS for idle nodes and the autoscaler, and never more
+# than FAIR_QUEUE_MAX.
+FAIR_PREFETCH_PER_SLOT = int(getattr(settings, "FAIR_PREFETCH_PER_SLOT", 2))
+FAIR_QUEUE_MAX = int(getattr(settings, "FAIR_QUEUE_MAX", 50))
+QUEUE_PUBLISH_INTERVAL = 2.0
+DEFAULT_BUILD_SECONDS = 60.0
+
+def _load_user_weights() -> dict:
+    weights = getattr(settings, "FAIR_SHARE_WEIGHTS", None) or {}
+    if isinstance(weights, str):
+        weights = json.loads(weights)
+    return {str(user): max(1, int(weight)) for user, weight in weights.items()}
+
+USER_WEIGHTS = _load_user_weights()
+
+def typical_build_seconds() -> float:
+    totals = sorted(v for phases in framework_timings.values() for v in phases.get("total", ()))
+    return _percentile(totals, 50) if totals else DEFAULT_BUILD_SECONDS
+
+def _wrr_next(ring: deque, credit: dict, queues: dict, eligible=lambda user: True):
+    """
+    Pop the next entry in weighted round-robin order: the user at the head
+    of `ring` takes up to its weight in turns, then moves to the back.
+    Users that aren't `eligible` are passed over for this round.
+    """
+    for _ in range(len(ring)):
+        user = ring[0]
+        if eligible(user):
+            if credit.get(user, 0) <= 0:
+                credit[user] = USER_WEIGHTS.get(user, 1)
+            credit[user] -= 1
+            entry = queues[user].popleft()
+            if not queues[user]:
+                ring.popleft()
+                del queues[user]
+                credit.pop(user, None)
+            elif credit[user] <= 0:
+                ring.rotate(-1)
+            return entry
+        credit.pop(user, None)
+        ring.rotate(-1)
+    return None
+
+@dataclass
+class QueuedTemplate:
+    template_id: str
+    user_id: str
+    admitted: asyncio.Future
+    position: Optional[int] = None
+
+class FairScheduler:
+    """
+    Admits heavy-lane templates into the pipeline by weighted round-robin
+    across uploaders, with at most PER_USER_MAX_IN_FLIGHT jobs per user in
+    the pipeline, so one bulk upload can't starve everyone else.
+
+    Queue positions and start estimates cover this worker's waiting jobs
+    only; other worker nodes schedule the messages they received.
+    """
+
+    def __init__(self, pipeline: "BuildPipeline", limiter: AdaptiveLimiter):
+        self.pipeline = pipeline
+        self.limiter = limiter
+        self.waiting = {}  # user_id -> deque[QueuedTemplate]
+        self.ring = deque()  # users with waiting work, in round-robin order
+        self.credit = {}
+        self.running = defaultdict(int)
+        self.queued = 0
+        # Admitted but not yet submitted to the pipeline
+        self.handing_off = 0
+        self.slot_freed = asyncio.Event()
+        self.last_published = 0.0
+        self.task = None
+
+    def free_slots(self) -> int:
+        build_slots = max(0, self.pipeline.free_slots() - self.handing_off)
+        return min(FAIR_QUEUE_MAX, FAIR_PREFETCH_PER_SLOT * build_slots) - self.queued
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(), name="fair-scheduler")
+
+    def enqueue(self, template_id: str, user_id: str) -> QueuedTemplate:
+        """Queue a template for admission. Callers keep within free_slots()."""
+        queue = self.waiting.get(user_id)
+        if queue is None:
+            queue = self.waiting[user_id] = deque()
+            self.ring.append(user_id)
+        entry = QueuedTemplate(template_id, user_id, asyncio.get_running_loop().create_future())
+        queue.append(entry)
+        self.queued += 1
+        self.start()
+        self.dispatch()
+        return entry
+
+    async def wait_turn(self, entry: QueuedTemplate) -> bool:
+        """False if the entry was released by drain() instead of admitted."""
+        try:
+            admitted = await entry.admitted
+        except asyncio.CancelledError:
+            self._discard(entry)
+            raise
+        if not admitted:
+            return False
+        self.handing_off -= 1
+        if entry.position is not None:
+            try:
+                await template_collection.update_one(
+                    {"_id": ObjectId(entry.template_id)},
+                    {"$unset": {"queue_position": "", "estimated_start_at": ""}},
+                )
+            except Exception as e:
+                logger.warning(f"Failed to clear queue position for template {entry.template_id}: {e}")
+        return True
+
+    def finished(self, entry: QueuedTemplate):
+        if entry.admitted.done() and not entry.admitted.cancelled() and entry.admitted.result():
+            self.running[entry.user_id] -= 1
+            if self.running[entry.user_id] <= 0:
+                del self.running[entry.user_id]
+            self.dispatch()
+
+    def _discard(self, entry: QueuedTemplate):
+        queue = self.waiting.get(entry.user_id)
+        if not queue or entry not in queue:
+            return
+        queue.remove(entry)
+        self.queued -= 1
+        if not queue:
+            del self.waiting[entry.user_id]
+            self.ring.remove(entry.user_id)
+            self.credit.pop(entry.user_id, None)
+        self.slot_freed.set()
+
+    def dispatch(self):
+        free = self.pipeline.free_slots() - self.handing_off
+        while free > 0:
+            entry = _wrr_next(
+                self.ring, self.credit, self.waiting,
+                eligible=lambda user: self.running.get(user, 0) < PER_USER_MAX_IN_FLIGHT,
+            )
+            if entry is None:
+                break
+            self.queued -= 1
+            self.running[entry.user_id] += 1
+            self.handing_off += 1
+            entry.admitted.set_result(True)
+            self.slot_freed.set()
+            free -= 1
+
+    def drain(self):
+        """Release every waiting entry unstarted, so its work can go back to the queue."""
+        for queue in self.waiting.values():
+            for entry in queue:
+                if not entry.admitted.done():
+                    entry.admitted.set_result(False)
+        self.waiting.clear()
+        self.ring.clear()
+        self.credit.clear()
+        self.queued = 0
+        self.slot_freed.set()
+
+    def projected_order(self) -> list:
+        """Waiting templates in the order they'd be admitted, ignoring per-user caps."""
+        ring = deque(self.ring)
+        credit = dict(self.credit)
+        queues = {user: deque(queue) for user, queue in self.waiting.items()}
+        order = []
+        while ring:
+            order.append(_wrr_next(ring, credit, queues))
+        return order
+
+    async def publish_positions(self):
+        """Persist queue_position / estimated_start_at for templates whose position moved."""
+        seconds_per_slot = typical_build_seconds() / max(1, self.limiter.limit)
+        now = datetime.utcnow()
+        for index, entry in enumerate(self.projected_order()):
+            position = index + 1
+            if entry.position == position:
+                continue
+            entry.position = position
+            await set_template_fields(entry.template_id, {
+                "queue_position": position,
+                "estimated_start_at": now + timedelta(seconds=position * seconds_per_slot),
+            })
+
+    async def run(self):
+        while True:
+            self.pipeline.slot_freed.clear()
+            self.dispatch()
+            if self.free_slots() > 0:
+                # Prefetch room follows the free build slots
+                self.slot_freed.set()
+            if self.waiting and time.monotonic() - self.last_published >= QUEUE_PUBLISH_INTERVAL:
+                self.last_published = time.monotonic()
+                try:
+                    await self.publish_positions()
+                except Exception as e:
+                    logger.warning(f"Failed to publish queue positions: {e}")
+            try:
+                await asyncio.wait_for(self.pipeline.slot_freed.wait(), timeout=QUEUE_PUBLISH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+scheduler = FairScheduler(pipeline, build_limiter)
 
 # -----------------------------
 # Template processing
 # -----------------------------
-async def process_template(template_id: str, upload_zip_key: str):
-    async with build_semaphore:
-        work_dir = None
-        zip_path = None
-        try:
-            logger.info(f"Processing template {template_id} (zip={upload_zip_key})")
-            work_dir = tempfile.mkdtemp(prefix=f"s8builder_{template_id}_")
-            zip_path = os.path.join(work_dir, os.path.basename(upload_zip_key))
+BUILD_MAX_ATTEMPTS = int(getattr(settings, "BUILD_MAX_ATTEMPTS", 3))
+BUILD_RETRY_BASE_SECONDS = float(getattr(settings, "BUILD_RETRY_BASE_SECONDS", 5))
+# Bad archives, a failing install/build command and a build that runs
+# out of time fail the same way every time. Only the rest (S3 download
+# and upload, Mongo) are worth retrying.
+PERMANENT_BUILD_ERRORS = (ValueError, zipfile.BadZipFile, subprocess.CalledProcessError, CommandTimeout)
 
-            async with get_s3_client() as s3_client:
-                await s3_client.download_file(BUCKET, upload_zip_key, zip_path)
+build_outcomes = defaultdict(int)
 
-            extract_dir = os.path.join(work_dir, "src")
-            unzip_to(zip_path, extract_dir)
-            entries = [e for e in os.listdir(extract_dir) if not e.startswith(".")]
-            if len(entries) == 1 and os.path.isdir(os.path.join(extract_dir, entries[0])):
-                extract_dir = os.path.join(extract_dir, entries[0])
+async def run_job(job: BuildJob, fast_lane: bool = False):
+    if fast_lane:
+        # Fetch outside the pipeline so static sites never queue behind
+        # heavy downloads; a misrouted npm project joins at the build stage.
+        if await run_stage_guarded(fetch_stage, job):
+            await pipeline.submit(job, stage="build")
+        else:
+            await complete_job(job)
+    else:
+        await pipeline.submit(job)
+    await job.done
 
-            out_dir = await build_project_if_needed(extract_dir)
-            logger.info(f"Build complete. Output={out_dir}")
+async def process_template(template_id: str, upload_zip_key: str, fast_lane: bool = False,
+                           on_queued=None) -> Optional[float]:
+    """
+    Returns None once the template's message can be deleted: it was built
+    (or failed for good), or no longer needs building. Otherwise returns
+    how many seconds to keep the message hidden before it is retried:
+    while a live lease elsewhere runs out, or when the worker began
+    draining first. `on_queued` is called once the template has joined the
+    fair queue.
+    """
+    if template_id in active_templates:
+        logger.info(f"Template {template_id} is already being processed by this worker, retrying later")
+        return await lease_time_left(template_id)
+    template = await claim_template(template_id)
+    if not template:
+        # Deleting the message here would strand the template if the lease
+        # holder died; retry once its lease has run out instead.
+        retry_after = await lease_time_left(template_id)
+        if retry_after is None:
+            logger.info(f"Template {template_id} no longer needs building, skipping")
+        else:
+            logger.info(f"Template {template_id} is leased by another worker, retrying in {retry_after:.0f}s")
+        return retry_after
 
-            s3_prefix = f"previews/{template_id}"
-            await upload_folder_to_s3(out_dir, s3_prefix)
-            preview_key = f"{s3_prefix}/index.html"
-            preview_url = await presign(preview_key, expires=3600)
-            await update_template_status(template_id, "ready", preview_url)
-            logger.info(f"Template {template_id} ready at {preview_url}")
+    entry = None
+    if stop_flag:
+        await release_lease(template_id)
+        return 0
+    if not fast_lane:
+        user_id = str(template.get("uploaded_by"))
+        entry = scheduler.enqueue(template_id, user_id)
+        if on_queued:
+            on_queued()
 
+    active_templates.add(template_id)
+    renewer = asyncio.create_task(hold_lease(template_id))
+    try:
+        if entry and not await scheduler.wait_turn(entry):
+            logger.info(f"Releasing template {template_id}: worker is draining")
+            return 0
+        build_log = build_logs[template_id] = BuildLog(template_id)
+        for attempt in range(1, BUILD_MAX_ATTEMPTS + 1):
+            job = BuildJob(template_id, upload_zip_key, build_log=build_log, attempt=attempt)
+            await run_job(job, fast_lane)
+            if job.error is None:
+                build_outcomes["ready"] += 1
+                if job.work_dir:
+                    # Deleting a node_modules tree can take seconds; keep it off the loop
+                    asyncio.get_running_loop().run_in_executor(None, safe_rmtree, job.work_dir)
+                break
+            if attempt == BUILD_MAX_ATTEMPTS or isinstance(job.error, PERMANENT_BUILD_ERRORS):
+                build_outcomes["error"] += 1
+                # The work dir is kept (until the work cache sweeper drops
+                # it) so a re-queued template resumes too
+                try:
+                    await fail_job(job, job.error)
+                except Exception as fail_err:
+                    logger.error(f"Failed to record error for template {template_id}: {fail_err}")
+                break
+            build_outcomes["retried"] += 1
+            delay = BUILD_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+            logger.warning(f"Retrying template {template_id} in {delay}s (attempt {attempt}/{BUILD_MAX_ATTEMPTS} failed)")
+            await asyncio.sleep(delay)
+    finally:
+        build_logs.pop(template_id, None)
+        renewer.cancel()
+        if entry:
+            scheduler.finished(entry)
+        active_templates.discard(template_id)
+        try:
+            await release_lease(template_id)
         except Exception as e:
-            logger.error(f"Error processing template {template_id}: {e}")
-            await update_template_status(template_id, "error", None)
-            dlq_url = getattr(settings, "SQS_DLQ_URL", None)
-            if dlq_url:
-                async with get_sqs_client() as sqs_client:
-                    await sqs_client.send_message(
-                        QueueUrl=dlq_url,
-                        MessageBody=json.dumps({"template_id": template_id, "s3_key": upload_zip_key})
-                    )
+            logger.warning(f"Failed to release lease on template {template_id}: {e}")
+    return None
+
+# -----------------------------
+# Generated apps (pre-warmed base workspace)
+# -----------------------------
+GENERATED_BASE_DIR = getattr(settings, "GENERATED_BASE_DIR", None) or os.path.join(tempfile.gettempdir(), "s8builder_generated_base")
+# The generator pins some packages to "latest", so bases are reinstalled
+# in the background once they reach this age.
+GENERATED_BASE_TTL_SECONDS = int(getattr(settings, "GENERATED_BASE_TTL_SECONDS", 24 * 3600))
+# Each preview build downloads a zip and links a full node_modules tree
+GENERATED_APP_CONCURRENCY = int(getattr(settings, "GENERATED_APP_CONCURRENCY", 2))
+
+_base_locks = defaultdict(asyncio.Lock)
+_base_refreshing = set()
+
+def base_workspace_key(pkg: dict, node_version: str) -> str:
+    """Hash of the dependency set; the rest of package.json (e.g. the random name) doesn't matter."""
+    deps = {section: pkg.get(section, {}) for section in ("dependencies", "devDependencies")}
+    return hashlib.sha256(f"{node_version}\0{json.dumps(deps, sort_keys=True)}".encode()).hexdigest()
+
+def _swap_in_base(key: str, staging: str):
+    base = os.path.join(GENERATED_BASE_DIR, key)
+    os.utime(staging, None)  # mtime is the install time
+    if os.path.isdir(base):
+        # Builds may still be copying from the old base; the hidden name
+        # gets it swept an hour from now, like a leftover staging dir.
+        retired = os.path.join(GENERATED_BASE_DIR, f".{key}.retired-{int(time.time())}")
+        os.rename(base, retired)
+        os.utime(retired, None)
+    os.rename(staging, base)
+
+def _sweep_hidden_bases():
+    for name in os.listdir(GENERATED_BASE_DIR):
+        path = os.path.join(GENERATED_BASE_DIR, name)
+        if name.startswith(".") and os.path.getmtime(path) < time.time() - 3600:
+            safe_rmtree(path)
+
+async def install_base_workspace(key: str, pkg: dict):
+    """npm install the dependency set in a staging dir, then swap it in as the base for `key`."""
+    os.makedirs(GENERATED_BASE_DIR, exist_ok=True)
+    await asyncio.to_thread(_sweep_hidden_bases)
+    staging = tempfile.mkdtemp(prefix=f".{key}.", dir=GENERATED_BASE_DIR)
+    try:
+        base_pkg = {**pkg, "name": "s8-generated-base"}
+        await asyncio.to_thread(_write_bytes, os.path.join(staging, "package.json"), json.dumps(base_pkg, indent=2).encode())
+        await run_async(["npm", "install", "--no-audit", "--no-fund"], cwd=staging, timeout=20*60,
+                        build_log=BuildLog(f"base:{key[:12]}"))
+        _swap_in_base(key, staging)
+    except Exception:
+        asyncio.get_running_loop().run_in_executor(None, safe_rmtree, staging)
+        raise
+    logger.info(f"Generated-app base {key[:12]} installed")
+
+async def refresh_base_workspace(key: str, pkg: dict):
+    if key in _base_refreshing:
+        return
+    _base_refreshing.add(key)
+    try:
+        await install_base_workspace(key, pkg)
+    except Exception as e:
+        logger.warning(f"Refreshing generated-app base {key[:12]} failed; keeping the old one: {e}")
+    finally:
+        _base_refreshing.discard(key)
+
+async def get_base_workspace(pkg: dict) -> str:
+    """The pre-installed base for this dependency set, installing it on first use."""
+    key = base_workspace_key(pkg, await get_node_version())
+    base = os.path.join(GENERATED_BASE_DIR, key)
+    async with _base_locks[key]:
+        if not os.path.isdir(base):
+            logger.info(f"No generated-app base for {key[:12]} yet; installing")
+            await install_base_workspace(key, pkg)
+        elif time.time() - os.path.getmtime(base) > GENERATED_BASE_TTL_SECONDS:
+            asyncio.create_task(refresh_base_workspace(key, pkg))
+    return base
+
+async def prewarm_generated_bases():
+    """Refresh stale bases at startup so the first preview after a deploy doesn't pay for it."""
+    if not os.path.isdir(GENERATED_BASE_DIR):
+        return
+    for key in os.listdir(GENERATED_BASE_DIR):
+        base = os.path.join(GENERATED_BASE_DIR, key)
+        if key.startswith(".") or time.time() - os.path.getmtime(base) <= GENERATED_BASE_TTL_SECONDS:
+            continue
+        pkg = read_package_json(base)
+        if pkg:
+            await refresh_base_workspace(key, pkg)
+
+async def build_generated_app(project_id: str, s3_key: str) -> str:
+    """
+    Overlay the generated sources on a copy of the base's node_modules, run
+    `vite build` and publish the output like a template preview. Returns
+    the preview's index key.
+    """
+    work_dir = tempfile.mkdtemp(prefix=f"s8builder_gen_{project_id}_")
+    try:
+        zip_path = os.path.join(work_dir, "app.zip")
+        app_dir = os.path.join(work_dir, "app")
+        async with get_s3_client() as s3_client:
+            await s3_client.download_file(BUCKET, s3_key, zip_path)
+        await asyncio.to_thread(unzip_to, zip_path, app_dir)
+
+        base = await get_base_workspace(read_package_json(app_dir) or {})
+        # Hardlinked, so it's quick, and a base refresh can't pull files out from under the build
+        await asyncio.to_thread(
+            shutil.copytree, os.path.join(base, "node_modules"), os.path.join(app_dir, "node_modules"),
+            symlinks=True, copy_function=_link_or_copy,
+        )
+
+        await build_limiter.acquire(project_id)
+        try:
+            # The preview is served from previews/<id>/, not the bucket root;
+            # relative asset URLs also cover zips from older generator versions
+            await run_async([os.path.join(app_dir, "node_modules", ".bin", "vite"), "build", "--base=./"], cwd=app_dir,
+                            timeout=10*60, build_log=BuildLog(f"gen:{project_id}"))
         finally:
-            if zip_path and os.path.exists(zip_path):
-                try: os.remove(zip_path)
-                except Exception: pass
-            if work_dir: safe_rmtree(work_dir)
+            await build_limiter.release()
+
+        out_dir = os.path.join(app_dir, "dist")
+        assets, _ = await asyncio.to_thread(prepare_folder_assets, out_dir, os.path.join(work_dir, "encoded"))
+        s3_prefix = f"previews/{project_id}"
+        await sync_preview_assets(project_id, assets, s3_prefix)
+        return f"{s3_prefix}/index.html"
+    finally:
+        asyncio.get_running_loop().run_in_executor(None, safe_rmtree, work_dir)
+
+generated_app_slots = asyncio.Semaphore(GENERATED_APP_CONCURRENCY)
+
+async def process_generated_app(project_id: str, s3_key: str):
+    async with generated_app_slots:
+        await run_generated_app(project_id, s3_key)
+
+async def run_generated_app(project_id: str, s3_key: str):
+    project = await generated_pages_collection.find_one({"_id": ObjectId(project_id)}, {"source_s3_key": 1})
+    if not project or project.get("source_s3_key") != s3_key:
+        logger.info(f"Skipping superseded preview build for generated app {project_id}")
+        return
+
+    await generated_pages_collection.update_one({"_id": ObjectId(project_id)}, {"$set": {"preview_status": "building"}})
+    started = time.monotonic()
+    try:
+        preview_key = await build_generated_app(project_id, s3_key)
+    except Exception as e:
+        logger.error(f"Preview build failed for generated app {project_id}: {e}")
+        await generated_pages_collection.update_one(
+            {"_id": ObjectId(project_id), "source_s3_key": s3_key},
+            {"$set": {"preview_status": "error", "preview_error": str(e)[-BUILD_LOG_TAIL_BYTES:]}},
+        )
+        return
+    await generated_pages_collection.update_one(
+        {"_id": ObjectId(project_id), "source_s3_key": s3_key},
+        {"$set": {"preview_status": "ready", "preview_key": preview_key}, "$unset": {"preview_error": ""}},
+    )
+    logger.info(f"Generated app {project_id} ready at {preview_key} in {time.monotonic() - started:.1f}s")
+
 # -----------------------------
-# Async SQS polling with debug
+# Async SQS consumer
 # -----------------------------
-async def poll_sqs():
-    logger.info("Starting async SQS polling...")
-    async with get_sqs_client() as sqs_client:
-        while not stop_flag:
+SQS_VISIBILITY_TIMEOUT = int(getattr(settings, "SQS_VISIBILITY_TIMEOUT", 300))
+SQS_HEARTBEAT_INTERVAL = max(SQS_VISIBILITY_TIMEOUT // 3, 10)
+SQS_DELETE_FLUSH_INTERVAL = 1.0
+SQS_FAST_QUEUE_URL = getattr(settings, "SQS_FAST_QUEUE_URL", None)
+FAST_LANE_CONCURRENCY = int(getattr(settings, "FAST_LANE_CONCURRENCY", 8))
+
+class SqsConsumer:
+    """
+    Continuously receives messages while the lane has a free slot, keeps
+    each running job's message invisible with periodic heartbeats, and
+    deletes it as soon as its own job finishes (batched).
+
+    The heavy lane prefetches a few messages per free build slot into the
+    fair scheduler (heartbeats keep them invisible while they wait);
+    generated app jobs count against the same budget and build GENERATED_APP_CONCURRENCY
+    at a time. The fast lane has its own fixed budget of `max_in_flight` jobs.
+    """
+
+    def __init__(self, queue_url: str, fast_lane: bool = False, max_in_flight: Optional[int] = None):
+        self.queue_url = queue_url
+        self.fast_lane = fast_lane
+        self.max_in_flight = max_in_flight
+        self.active = {}  # MessageId -> Task
+        # Heavy-lane messages outside the fair queue that still take a slot:
+        # templates being claimed, and generated-app jobs (which never join it)
+        self.unqueued = set()
+        self.pending_deletes = []
+        self.sqs_client = None
+        self.slot_freed = scheduler.slot_freed if max_in_flight is None else asyncio.Event()
+
+    def free_slots(self) -> int:
+        if self.max_in_flight is None:
+            return scheduler.free_slots() - len(self.unqueued)
+        return self.max_in_flight - len(self.active)
+
+    async def run(self):
+        logger.info(f"Starting SQS consumer for {self.queue_url}")
+        async with get_sqs_client() as sqs_client:
+            self.sqs_client = sqs_client
+            flusher = asyncio.create_task(self._flush_deletes_forever())
             try:
-                # DEBUG: indicate polling attempt
-                logger.info("Polling SQS queue for messages...")
-                
-                resp = await sqs_client.receive_message(
-                    QueueUrl=settings.SQS_QUEUE_URL,
-                    MaxNumberOfMessages=5,
-                    WaitTimeSeconds=5,  # shorter for faster debug
-                    VisibilityTimeout=300,
+                while not stop_flag:
+                    try:
+                        await self._receive()
+                    except Exception as e:
+                        logger.error(f"SQS polling error: {e}")
+                        await asyncio.sleep(5)
+                await self._drain()
+            finally:
+                flusher.cancel()
+                await self._flush_deletes()
+
+    async def _receive(self):
+        last_poll[self.queue_url] = time.monotonic()
+        free = self.free_slots()
+        if free <= 0:
+            self.slot_freed.clear()
+            try:
+                await asyncio.wait_for(self.slot_freed.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        resp = await self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(free, 10),
+            WaitTimeSeconds=10,
+            VisibilityTimeout=SQS_VISIBILITY_TIMEOUT,
+        )
+        messages = resp.get("Messages", [])
+        if messages and stop_flag:
+            # Long poll finished after the drain began; hand them straight back
+            await asyncio.gather(*(self._release(m, 0) for m in messages))
+            return
+        if messages:
+            logger.info(f"Received {len(messages)} message(s) from SQS ({free} free slot(s)).")
+        for m in messages:
+            if self.max_in_flight is None:
+                self.unqueued.add(m["MessageId"])
+            self.active[m["MessageId"]] = asyncio.create_task(self._handle(m))
+        # Let the new jobs register with the pipeline before free slots are counted again
+        await asyncio.sleep(0)
+
+    async def _handle(self, message: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(message))
+        retry_after = None
+        try:
+            body = json.loads(message["Body"])
+            if body.get("kind") == "generated_app":
+                await process_generated_app(str(body["project_id"]), body["s3_key"])
+            else:
+                retry_after = await process_template(
+                    str(body["template_id"]), body["s3_key"], fast_lane=self.fast_lane,
+                    on_queued=functools.partial(self.unqueued.discard, message["MessageId"]),
                 )
-                messages = resp.get("Messages", [])
-                
-                if messages:
-                    logger.info(f"Received {len(messages)} message(s) from SQS.")
-                    tasks = [
-                        process_template(
-                            str(json.loads(m["Body"])["template_id"]),
-                            json.loads(m["Body"])["s3_key"]
-                        )
-                        for m in messages
-                    ]
-                    await asyncio.gather(*tasks)
-                    for m in messages:
-                        await sqs_client.delete_message(
-                            QueueUrl=settings.SQS_QUEUE_URL,
-                            ReceiptHandle=m["ReceiptHandle"]
-                        )
-                        logger.info(f"Deleted message {m['MessageId']} from queue.")
-                else:
-                    logger.info("SQS queue empty, waiting for new messages...")
-                    await asyncio.sleep(2)
+        except asyncio.CancelledError:
+            # Cut off at the drain deadline; let another node start over now
+            retry_after = 0
+            raise
+        except Exception as e:
+            # process_template records build failures itself; this only
+            # catches malformed messages, which would never succeed anyway.
+            logger.error(f"Failed to handle message {message['MessageId']}: {e}")
+        finally:
+            heartbeat.cancel()
+            if retry_after is not None:
+                await self._release(message, 0 if stop_flag else math.ceil(retry_after))
+            else:
+                self.pending_deletes.append(message)
+            self.active.pop(message["MessageId"], None)
+            self.unqueued.discard(message["MessageId"])
+            self.slot_freed.set()
 
+    async def _release(self, message: dict, delay: int):
+        """Hand a message back to the queue, visible again after `delay` seconds."""
+        try:
+            await self.sqs_client.change_message_visibility(
+                QueueUrl=self.queue_url,
+                ReceiptHandle=message["ReceiptHandle"],
+                VisibilityTimeout=delay,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release message {message['MessageId']}: {e}")
+
+    async def _drain(self):
+        """Let running jobs finish until the drain deadline, then return the rest to the queue."""
+        if not self.active:
+            return
+        logger.info(f"Draining {len(self.active)} in-flight job(s) from {self.queue_url} ({drain_time_left():.0f}s left)...")
+        unfinished = await wait_until_drained(self.active.values())
+        if unfinished:
+            logger.warning(f"{len(unfinished)} job(s) were still running at the drain deadline; returned their messages")
+
+    async def _heartbeat(self, message: dict):
+        while True:
+            await asyncio.sleep(SQS_HEARTBEAT_INTERVAL)
+            try:
+                await self.sqs_client.change_message_visibility(
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=message["ReceiptHandle"],
+                    VisibilityTimeout=SQS_VISIBILITY_TIMEOUT,
+                )
             except Exception as e:
-                logger.error(f"SQS polling error: {e}")
-                await asyncio.sleep(5)
+                logger.warning(f"Visibility heartbeat failed for {message['MessageId']}: {e}")
 
+    async def _flush_deletes_forever(self):
+        while True:
+            await asyncio.sleep(SQS_DELETE_FLUSH_INTERVAL)
+            try:
+                await self._flush_deletes()
+            except Exception as e:
+                logger.error(f"SQS delete flush error: {e}")
+
+    async def _flush_deletes(self):
+        while self.pending_deletes:
+            batch = self.pending_deletes[:10]
+            resp = await self.sqs_client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]} for i, m in enumerate(batch)],
+            )
+            del self.pending_deletes[:len(batch)]
+            for ok in resp.get("Successful", []):
+                logger.info(f"Deleted message {batch[int(ok['Id'])]['MessageId']} from queue.")
+            for failed in resp.get("Failed", []):
+                logger.warning(f"Failed to delete message {batch[int(failed['Id'])]['MessageId']}: {failed.get('Message')}")
 
+# Queue URL -> when its consumer last went round the receive loop
+last_poll = {}
+
+async def poll_sqs():
+    consumers = [SqsConsumer(settings.SQS_QUEUE_URL)]
+    if SQS_FAST_QUEUE_URL:
+        consumers.append(SqsConsumer(SQS_FAST_QUEUE_URL, fast_lane=True, max_in_flight=FAST_LANE_CONCURRENCY))
+    await asyncio.gather(*(c.run() for c in consumers))
 
 # -----------------------------
 # Recover pending templates
 # -----------------------------
+# True while startup recovery runs, before the SQS consumers start polling
+recovering = False
+
 async def process_stuck_templates():
-    pending = [t async for t in template_collection.find({"status": "pending"})]
-    if not pending:
+    """
+    Build the templates that were already stuck at startup, at most
+    RECOVERY_CONCURRENCY at a time, claiming each one first so several
+    worker nodes can recover side by side. A freed slot goes to the oldest
+    upload from a user not already being recovered.
+    """
+    global recovering
+    recovering = True
+    try:
+        await recover_pending_templates()
+    finally:
+        recovering = False
+
+async def recover_pending_templates():
+    # Newer templates still have an SQS message that will deliver them.
+    # Recovering those too would let a steady stream of uploads keep
+    # recovery, and so SQS polling, from ever finishing.
+    stale_before = datetime.utcnow() - timedelta(seconds=SQS_VISIBILITY_TIMEOUT)
+    running = {}  # task -> uploaded_by
+    processed = 0
+    exhausted = False
+    while not stop_flag and not exhausted:
+        while len(running) < RECOVERY_CONCURRENCY:
+            users = set(running.values())
+            t = (await claim_next_pending(users, created_before=stale_before)
+                 or await claim_next_pending(created_before=stale_before))
+            if not t:
+                exhausted = True
+                break
+            if not t.get("zip_s3_key"):
+                # Left leased so the claim loop doesn't keep re-claiming it
+                logger.warning(f"No zip_s3_key for {t['_id']}")
+                continue
+            task = asyncio.create_task(process_template(str(t["_id"]), t["zip_s3_key"]))
+            running[task] = t.get("uploaded_by")
+        if exhausted or not running:
+            break
+        # Claim the next one as soon as any slot frees
+        done, _ = await asyncio.wait(running, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            running.pop(task)
+            processed += 1
+
+    unfinished = await wait_until_drained(running)
+    if unfinished:
+        # Their leases are released, so another node's recovery picks them up
+        logger.warning(f"{len(unfinished)} recovered template(s) were still building at the drain deadline; abandoned")
+    processed += len(running) - len(unfinished)
+
+    if processed:
+        logger.info(f"Processed {processed} pending template(s).")
+    else:
         logger.info("No pending templates to process.")
-        return
 
-    tasks = []
-    for t in pending:
-        s3_key = t.get("zip_s3_key")
-        if not s3_key:
-            logger.warning(f"No zip_s3_key for {t['_id']}")
-            continue
-        tasks.append(process_template(str(t["_id"]), s3_key))
+# -----------------------------
+# Event loop lag
+# -----------------------------
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_WARN_SECONDS = 0.25
+loop_lag = {"last": 0.0, "max": 0.0}
+
+async def monitor_loop_lag():
+    """Measure how late the loop wakes a fixed-interval sleep; blocking calls show up here."""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL)
+        loop_lag["last"] = lag
+        loop_lag["max"] = max(loop_lag["max"], lag)
+        if lag > LOOP_LAG_WARN_SECONDS:
+            logger.warning(f"Event loop lagged {lag:.3f}s")
+
+# -----------------------------
+# Health and metrics HTTP server
+# -----------------------------
+METRICS_HOST = getattr(settings, "WORKER_METRICS_HOST", "0.0.0.0")
+# Away from node_exporter's 9100; a second worker on the same host needs its own port
+METRICS_PORT = int(getattr(settings, "WORKER_METRICS_PORT", 9478))
+QUEUE_DEPTH_INTERVAL = 15
+# A consumer that hasn't gone round its loop for this long is stuck
+READY_MAX_POLL_AGE = 60
+
+queue_depths = {}  # lane -> {"visible": n, "in_flight": n}
+
+def sqs_lanes() -> dict:
+    lanes = {"heavy": settings.SQS_QUEUE_URL}
+    if SQS_FAST_QUEUE_URL:
+        lanes["fast"] = SQS_FAST_QUEUE_URL
+    return lanes
+
+async def monitor_queue_depths():
+    """Poll ApproximateNumberOfMessages per lane; the autoscaler scales on it."""
+    async with get_sqs_client() as sqs_client:
+        while True:
+            for lane, url in sqs_lanes().items():
+                try:
+                    resp = await sqs_client.get_queue_attributes(
+                        QueueUrl=url,
+                        AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+                    )
+                    attrs = resp.get("Attributes", {})
+                    queue_depths[lane] = {
+                        "visible": int(attrs.get("ApproximateNumberOfMessages", 0)),
+                        "in_flight": int(attrs.get("ApproximateNumberOfMessagesNotVisible", 0)),
+                    }
+                except Exception as e:
+                    logger.warning(f"Failed to read SQS depth for {lane} lane: {e}")
+            await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+
+def _metric(lines: list, name: str, kind: str, help_text: str, samples):
+    """Append one metric in Prometheus text format; samples are (labels, value) pairs."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+
+def render_metrics() -> str:
+    lines = []
+    _metric(lines, "s8_worker_builds_in_flight", "gauge", "Jobs inside the build pipeline.",
+            [({}, pipeline.in_flight)])
+    _metric(lines, "s8_worker_stage_queue_length", "gauge", "Jobs queued for each pipeline stage.",
+            [({"stage": name}, n) for name, n in pipeline.queue_lengths().items()])
+    _metric(lines, "s8_worker_stage_jobs", "gauge", "Jobs queued for or running in each pipeline stage.",
+            [({"stage": name}, n) for (name, _, _), n in zip(pipeline.stages, pipeline.stage_counts)])
+    _metric(lines, "s8_worker_fair_queue_waiting", "gauge", "Templates waiting for admission.",
+            [({}, scheduler.queued)])
+    _metric(lines, "s8_worker_build_concurrency_limit", "gauge", "Current adaptive build concurrency.",
+            [({}, build_limiter.limit)])
+    _metric(lines, "s8_worker_builds_total", "counter", "Template attempts by outcome.",
+            [({"outcome": outcome}, n) for outcome, n in sorted(build_outcomes.items())])
 
-    if tasks:
-        await asyncio.gather(*tasks)
-        logger.info(f"Processed {len(tasks)} pending template(s).")
+    duration = "s8_worker_build_duration_seconds"
+    lines.append(f"# HELP {duration} Wall time per framework and phase over recent builds.")
+    lines.append(f"# TYPE {duration} summary")
+    for framework, phases in framework_timings.items():
+        for phase, values in phases.items():
+            ordered = sorted(values)
+            if not ordered:
+                continue
+            labels = f'framework="{framework}",phase="{phase}"'
+            for q in (50, 90, 99):
+                lines.append(f'{duration}{{{labels},quantile="{q / 100}"}} {_percentile(ordered, q)}')
+            lines.append(f"{duration}_sum{{{labels}}} {round(sum(ordered), 3)}")
+            lines.append(f"{duration}_count{{{labels}}} {len(ordered)}")
+
+    _metric(lines, "s8_worker_dependency_cache_total", "counter", "node_modules cache lookups.",
+            [({"result": result}, n) for result, n in dep_cache_stats.items()])
+    _metric(lines, "s8_worker_build_dedupe_total", "counter", "Zip SHA-256 build cache lookups.",
+            [({"result": result}, n) for result, n in build_cache_stats.items()])
+    _metric(lines, "s8_worker_event_loop_lag_seconds", "gauge", "Event loop lag (last sample and max seen).",
+            [({"stat": stat}, round(value, 4)) for stat, value in loop_lag.items()])
+    _metric(lines, "s8_worker_sqs_messages", "gauge", "SQS ApproximateNumberOfMessages(NotVisible) per lane.",
+            [({"lane": lane, "state": state}, n) for lane, depth in queue_depths.items() for state, n in depth.items()])
+    _metric(lines, "s8_worker_draining", "gauge", "1 while the worker drains for shutdown.",
+            [({}, int(stop_flag))])
+    return "\n".join(lines) + "\n"
+
+async def handle_live(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "worker": WORKER_ID, "loop_lag": loop_lag["last"]})
+
+async def handle_ready(request: web.Request) -> web.Response:
+    if recovering and not stop_flag:
+        # Startup recovery can run for hours before polling starts; it is working, not stuck
+        return web.json_response({"status": "recovering", "builds_in_flight": pipeline.in_flight})
+    now = time.monotonic()
+    stale = [url for url in sqs_lanes().values() if now - last_poll.get(url, 0) > READY_MAX_POLL_AGE]
+    if stop_flag or stale:
+        reason = "draining" if stop_flag else "not polling"
+        return web.json_response({"status": reason, "queues": stale}, status=503)
+    return web.json_response({"status": "ready", "builds_in_flight": pipeline.in_flight})
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+async def handle_build_log(request: web.Request) -> web.StreamResponse:
+    """Tail of a running build's output, then live lines until the build ends."""
+    template_id = request.match_info["template_id"]
+    build_log = build_logs.get(template_id)
+    if not build_log:
+        raise web.HTTPNotFound(text=f"No running build for {template_id}\n")
+    response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+    await response.prepare(request)
+    q = build_log.subscribe()
+    try:
+        if build_log.lines:
+            await response.write((build_log.tail() + "\n").encode())
+        while build_logs.get(template_id) is build_log:
+            try:
+                line = await asyncio.wait_for(q.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            await response.write((line + "\n").encode())
+    finally:
+        build_log.unsubscribe(q)
+    return response
+
+async def start_health_server() -> Optional[web.AppRunner]:
+    """None if the server can't start; the worker then runs without it."""
+    app = web.Application()
+    app.add_routes([
+        web.get("/healthz", handle_live),
+        web.get("/readyz", handle_ready),
+        web.get("/metrics", handle_metrics),
+        web.get("/builds/{template_id}/log", handle_build_log),
+    ])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    except OSError as e:
+        logger.error(f"Health and metrics server could not bind {METRICS_HOST}:{METRICS_PORT} ({e}); running without it")
+        await runner.cleanup()
+        return None
+    logger.info(f"Health and metrics server listening on {METRICS_HOST}:{METRICS_PORT}")
+    return runner
 
 # -----------------------------
 # Main loop
@@ -349,7 +2375,12 @@ if __name__ == "__main__":
         Recover pending templates and continuously poll SQS.
         Loops indefinitely and handles exceptions gracefully.
         """
-        global stop_flag
+        install_signal_handlers()
+        asyncio.create_task(monitor_loop_lag())
+        asyncio.create_task(monitor_queue_depths())
+        asyncio.create_task(prewarm_generated_bases())
+        asyncio.create_task(sweep_work_cache_forever())
+        health_server = await start_health_server()
         while not stop_flag:
             try:
                 logger.info("Starting recovery of pending templates...")
@@ -362,6 +2393,8 @@ if __name__ == "__main__":
                 logger.error(f"Worker encountered an error: {e}")
                 await asyncio.sleep(5)  # backoff before retry
 
+        if health_server:
+            await health_server.cleanup()
         logger.info("Worker shutdown complete.")
 
     # Run the worker forever
@@ -0,0 +1,80 @@
+# bench/bench_s3_upload.py
+"""
+Sequential vs concurrent preview upload against a local S3 stand-in.
+
+Start an S3-compatible server and point the worker settings at it, e.g.
+
+    docker run -p 9000:9000 minio/minio server /data     # or: moto_server -p 9000
+    S3_ENDPOINT_URL=http://localhost:9000 BUCKET_NAME=bench \
+        python bench/bench_s3_upload.py --files 400 --size-kb 64
+
+Both runs go through upload_assets_to_s3 with the same generated build
+output; the baseline just pins UPLOAD_CONCURRENCY to 1. moto_server handles
+one request at a time, so use MinIO when the numbers matter.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import worker  # noqa: E402
+
+
+def make_assets(files: int, size_kb: int) -> list:
+    assets = []
+    for i in range(files):
+        body = os.urandom(size_kb * 1024)
+        rel = f"assets/chunk-{i:05d}.js"
+        assets.append(worker.Asset(
+            rel, len(body), worker.asset_headers(rel), hashlib.sha256(body).hexdigest(), body=body,
+        ))
+    return assets
+
+
+async def ensure_bucket():
+    async with worker.get_s3_client() as s3_client:
+        try:
+            await s3_client.head_bucket(Bucket=worker.BUCKET)
+        except Exception:
+            await s3_client.create_bucket(Bucket=worker.BUCKET)
+
+
+async def timed_upload(assets: list, concurrency: int) -> dict:
+    worker.UPLOAD_CONCURRENCY = concurrency
+    prefix = f"bench/{uuid.uuid4().hex}"
+    started = time.monotonic()
+    await worker.upload_assets_to_s3(assets, prefix)
+    elapsed = time.monotonic() - started
+    await worker.delete_s3_keys([f"{prefix}/{a.rel}" for a in assets])
+    return {"concurrency": concurrency, "seconds": elapsed}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--size-kb", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=worker.UPLOAD_CONCURRENCY)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if not worker.S3_ENDPOINT_URL:
+        sys.exit("S3_ENDPOINT_URL is not set; refusing to benchmark against real S3")
+
+    await ensure_bucket()
+    assets = make_assets(args.files, args.size_kb)
+    mb = sum(a.size for a in assets) / (1024 * 1024)
+    print(f"{args.files} file(s), {mb:.1f} MB -> {worker.S3_ENDPOINT_URL}/{worker.BUCKET}")
+
+    for concurrency in (1, args.concurrency):
+        runs = [await timed_upload(assets, concurrency) for _ in range(args.rounds)]
+        best = min(r["seconds"] for r in runs)
+        print(f"concurrency={concurrency:>3}  best {best:.2f}s  {mb / best:.1f} MB/s  {args.files / best:.0f} files/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# bench/bench_unzip_loop_lag.py
+"""
+Event-loop lag while extracting a large archive, inline vs off-loop.
+
+    python bench/bench_unzip_loop_lag.py --files 2000 --size-kb 256
+
+Builds a throwaway zip of incompressible files, then runs unzip_to twice:
+once directly on the loop (the old behaviour) and once through
+asyncio.to_thread. A ticker sleeping LOOP_LAG_INTERVAL / 10 records how
+late each wakeup is; max and p99 lag are what a concurrent health check
+or SQS heartbeat would have seen.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import worker  # noqa: E402
+
+
+def make_zip(path: str, files: int, size_kb: int):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(files):
+            zf.writestr(f"project/src/file-{i:05d}.bin", os.urandom(size_kb * 1024))
+
+
+async def sample_lag(stop: asyncio.Event, interval: float, lags: list):
+    while not stop.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.monotonic() - started - interval))
+
+
+async def run(mode: str, zip_path: str, dst: str, interval: float) -> dict:
+    lags = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(sample_lag(stop, interval, lags))
+    await asyncio.sleep(interval * 2)  # let the ticker settle
+    started = time.monotonic()
+    if mode == "inline":
+        worker.unzip_to(zip_path, dst)
+    else:
+        await asyncio.to_thread(worker.unzip_to, zip_path, dst)
+    elapsed = time.monotonic() - started
+    stop.set()
+    await ticker
+    lags.sort()
+    return {
+        "mode": mode,
+        "seconds": elapsed,
+        "max": lags[-1] if lags else 0.0,
+        "p99": lags[int(len(lags) * 0.99)] if lags else 0.0,
+        "samples": len(lags),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size-kb", type=int, default=256)
+    args = parser.parse_args()
+
+    interval = worker.LOOP_LAG_INTERVAL / 10
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = os.path.join(tmp, "bench.zip")
+        make_zip(zip_path, args.files, args.size_kb)
+        mb = os.path.getsize(zip_path) / (1024 * 1024)
+        print(f"{args.files} file(s), {mb:.1f} MB archive")
+
+        for mode in ("inline", "to_thread"):
+            r = await run(mode, zip_path, os.path.join(tmp, mode), interval)
+            print(
+                f"{mode:>9}  extract {r['seconds']:.2f}s  loop lag max {r['max'] * 1000:.0f}ms  "
+                f"p99 {r['p99'] * 1000:.0f}ms  ({r['samples']} samples)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())